@@ -0,0 +1 @@
+"""Micro-benchmarks of the backend's hot paths."""
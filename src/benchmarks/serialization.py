@@ -0,0 +1,92 @@
+"""Compare FastAPI's default JSON path with FastJSONResponse.
+
+Run from the `src` directory: `python -m benchmarks.serialization`.
+"""
+import random
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from timeit import repeat
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from modules.fastapi_utils import CustomListingModel, FastJSONResponse
+
+
+def listings_payload(size: int) -> list:
+    """Build a /listings page of CustomListingModel."""
+    now = datetime.now()
+    return [CustomListingModel(trackingId=i,
+                               lot=i % 5,
+                               kind="federal_44",
+                               name=f"Поставка оборудования №{i}",
+                               companyInn=7700000000 + i,
+                               basePrice=random.uniform(1e3, 1e6),
+                               isActive=i % 3 != 0,
+                               dynamic=random.choice((-1, 0, 1)),
+                               tsEnd=now + timedelta(days=i % 30),
+                               tsBegin=now,
+                               bidCount=i % 40,
+                               lowestBid=random.uniform(1e3, 1e6),
+                               latestBid=random.uniform(1e3, 1e6),
+                               latestBidTs=now)
+            for i in range(size)]
+
+
+def bids_payload(size: int) -> list:
+    """Build a /listing/bids page of raw bid documents."""
+    now = datetime.now()
+    return [{"_id": ObjectId(),
+             "listingTrackingId": 1,
+             "listingLot": 1,
+             "bidderInn": 7700000000 + i,
+             "bidPrice": random.uniform(1e3, 1e6),
+             "ts": now - timedelta(minutes=i)}
+            for i in range(size)]
+
+
+def statistics_payload(size: int) -> list:
+    """Build a /stats/* series."""
+    return [{"x": str(i), "y": random.randint(0, 1000)}
+            for i in range(size)]
+
+
+def default_render(payload) -> bytes:
+    """Render like FastAPI does by default.
+
+    Beanie documents encode their ObjectIds through the model config, the
+    custom encoder does the same for the raw documents.
+    """
+    return JSONResponse(jsonable_encoder(payload,
+                                         custom_encoder={ObjectId: str})).body
+
+
+def fast_render(payload) -> bytes:
+    """Render with FastJSONResponse returned directly from a route."""
+    return FastJSONResponse(payload).body
+
+
+def main():
+    """Time both paths on every payload and print the speedup."""
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    payloads = {"listings": listings_payload(args.size),
+                "bids": bids_payload(args.size),
+                "statistics": statistics_payload(args.size)}
+    print(f"{'payload':<12}{'default ms':>12}{'orjson ms':>12}{'speedup':>10}")
+    for name, payload in payloads.items():
+        timings = []
+        for render in (default_render, fast_render):
+            best = min(repeat(lambda: render(payload),
+                              number=args.number, repeat=5))
+            timings.append(best / args.number * 1000)
+        print(f"{name:<12}{timings[0]:>12.2f}{timings[1]:>12.2f}"
+              f"{timings[0] / timings[1]:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Maintenance commands for the backend.
+
+Run from the `src` directory, e.g. `python manage.py repair-bids`.
+"""
+import asyncio
+from argparse import ArgumentParser, Namespace
+from os import getenv
+
+from datetime import date
+from modules.database import rollup, activity
+from modules.database.seed import seed_fixtures
+from modules.events import broker
+from modules.database.db import init_db, close_db, repair_bid_state, \
+    migrate_statistics_proto, close_expired_custom_listings, \
+    backfill_search_terms
+
+
+async def connect_db(dedupe_bids: bool = False):
+    """Connect to the database configured in the environment."""
+    await init_db(getenv("MONGODB_USER", ""),
+                  getenv("MONGODB_PASS", ""),
+                  getenv("MONGODB_HOST", ""),
+                  getenv("MONGODB_PORT", ""),
+                  dedupe_bids=dedupe_bids)
+
+
+async def dedupe_bids(args: Namespace):
+    """Drop all but the earliest bid of a company on a Custom Listing."""
+    await connect_db(dedupe_bids=True)
+    print("Bids are unique, the dropped ones are logged above")
+
+
+async def repair_bids(args: Namespace):
+    """Recompute bid summaries and dynamics of all Custom Listings."""
+    await connect_db()
+    processed = await repair_bid_state(args.batch_size)
+    print(f"Recomputed bid summaries of {processed} listings")
+
+
+async def migrate_statistics(args: Namespace):
+    """Split the legacy statistics document into per-series documents."""
+    await connect_db()
+    migrated = await migrate_statistics_proto()
+    print(f"Migrated {migrated} statistics series")
+
+
+async def rollup_statistics(args: Namespace):
+    """Recompute the statistics rollups from bids, listings and signups."""
+    await connect_db()
+    events = await rollup.backfill(args.batch_size)
+    for metric, count in events.items():
+        print(f"Rolled up {count} {metric}")
+
+
+async def activity_metrics(args: Namespace):
+    """Compute the DAU/WAU/MAU metrics of a day from activity bitmaps."""
+    await connect_db()
+    if args.backfill_roles:
+        for role, count in (await activity.backfill_roles()).items():
+            print(f"Marked {count} users as {role}")
+    values = await activity.compute_metrics(args.day)
+    for name, segments in values.items():
+        print(name, segments)
+
+
+async def close_auctions(args: Namespace):
+    """Deactivate the Custom Listings whose tsEnd has passed."""
+    await connect_db()
+    closed = await close_expired_custom_listings(args.batch_size)
+    print(f"Closed {closed} expired listings")
+
+
+async def index_search(args: Namespace):
+    """Compute the search terms of listings created before search."""
+    await connect_db()
+    updated = await backfill_search_terms(args.batch_size)
+    print(f"Indexed {updated} listings for search")
+
+
+async def seed(args: Namespace):
+    """Seed the scripts, tasks, goals, metrics and statistics fixtures."""
+    await connect_db()
+    if await seed_fixtures(force=args.force):
+        print("Seeded the fixtures")
+    else:
+        print("Fixtures are already seeded, pass --force to upsert them")
+
+
+async def run(args: Namespace):
+    """Run the selected command and close the database client.
+
+    The caches the command invalidated are then invalidated in the
+    serving workers too.
+    """
+    try:
+        await args.handler(args)
+        await broker.flush_invalidations()
+    finally:
+        close_db()
+
+
+def main():
+    """Parse the command line and run the selected command."""
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seeding = commands.add_parser("seed", help=seed.__doc__)
+    seeding.add_argument("--force", action="store_true",
+                         help="upsert the fixtures even if already seeded")
+    seeding.set_defaults(handler=seed)
+
+    dedupe = commands.add_parser("dedupe-bids", help=dedupe_bids.__doc__)
+    dedupe.set_defaults(handler=dedupe_bids)
+
+    repair = commands.add_parser("repair-bids",
+                                 help=repair_bids.__doc__)
+    repair.add_argument("--batch-size", type=int, default=500)
+    repair.set_defaults(handler=repair_bids)
+
+    migrate = commands.add_parser("migrate-statistics",
+                                  help=migrate_statistics.__doc__)
+    migrate.set_defaults(handler=migrate_statistics)
+
+    backfill = commands.add_parser("rollup-statistics",
+                                   help=rollup_statistics.__doc__)
+    backfill.add_argument("--batch-size", type=int, default=10000)
+    backfill.set_defaults(handler=rollup_statistics)
+
+    metrics = commands.add_parser("activity-metrics",
+                                  help=activity_metrics.__doc__)
+    metrics.add_argument("--day", type=date.fromisoformat, default=None,
+                         help="YYYY-MM-DD, today by default")
+    metrics.add_argument("--backfill-roles", action="store_true",
+                         help="mark existing bidders and listing owners")
+    metrics.set_defaults(handler=activity_metrics)
+
+    closing = commands.add_parser("close-auctions",
+                                  help=close_auctions.__doc__)
+    closing.add_argument("--batch-size", type=int, default=500)
+    closing.set_defaults(handler=close_auctions)
+
+    indexing = commands.add_parser("index-search",
+                                   help=index_search.__doc__)
+    indexing.add_argument("--batch-size", type=int, default=1000)
+    indexing.set_defaults(handler=index_search)
+
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
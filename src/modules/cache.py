@@ -0,0 +1,115 @@
+"""In-process caches."""
+import asyncio
+from collections import OrderedDict
+from os import getenv
+from time import monotonic
+from typing import Any, Dict, Hashable
+
+# Caches whose invalidations reach every worker, by name
+shared_caches: Dict[str, "TTLCache"] = {}
+# Invalidations of the shared caches waiting to be relayed to the other
+# workers (see events.broker): {(cache name, key or None for all), ...}
+pending_invalidations: Dict[tuple, None] = {}
+invalidations_pending = asyncio.Event()
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a time-to-live.
+
+    Every operation is synchronous (no awaits), so a cache can be shared
+    by all coroutines of an event loop without locking.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str | None = None):
+        """Create a cache of at most `maxsize` entries living `ttl` seconds.
+
+        A named cache is shared: its invalidations reach every worker.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        if name is not None:
+            shared_caches[name] = self
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = \
+            OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a live entry and mark it as recently used."""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] <= monotonic():
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any,
+            ttl: float | None = None):
+        """Store an entry, evicting the least recently used ones."""
+        if self.maxsize <= 0:
+            return
+        expires_at = monotonic() + (self.ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable, relay: bool = True):
+        """Drop an entry if it is cached (in every worker if shared)."""
+        self._entries.pop(key, None)
+        if relay:
+            self._relay(key)
+
+    def clear(self, relay: bool = True):
+        """Drop all entries (in every worker if shared)."""
+        self._entries.clear()
+        if relay:
+            self._relay(None)
+
+    def _relay(self, key: Hashable | None):
+        """Queue an invalidation for the other workers if shared."""
+        if self.name is not None:
+            pending_invalidations[(self.name, key)] = None
+            invalidations_pending.set()
+
+    def stats(self) -> dict:
+        """Get the cache size and hit/miss counters."""
+        return {"size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses}
+
+
+# Authenticated users (UserModel) by email
+user_cache = TTLCache(int(getenv("USER_CACHE_SIZE", "10000")),
+                      float(getenv("USER_CACHE_TTL", "60")),
+                      "users")
+
+# Verified JWT payloads by token digest; entries expire with the token
+token_cache = TTLCache(int(getenv("TOKEN_CACHE_SIZE", "10000")),
+                       float(getenv("TOKEN_CACHE_TTL", "1800")))
+
+# Company names (None if unset) or UNKNOWN_COMPANY by INN; entries are
+# invalidated when a company's name or INN changes
+company_cache = TTLCache(int(getenv("COMPANY_CACHE_SIZE", "100000")),
+                         float(getenv("COMPANY_CACHE_TTL", "300")),
+                         "companies")
+UNKNOWN_COMPANY = object()
+
+# Script and task catalogues by name; cleared whenever they are seeded
+catalogue_cache = TTLCache(16, float(getenv("CATALOGUE_CACHE_TTL", "300")),
+                           "catalogues")
+
+# CachedResponse of the statistics endpoints by (granularity, pid);
+# cleared whenever statistics are rewritten
+stats_response_cache = TTLCache(int(getenv("STATS_CACHE_SIZE", "1000")),
+                                float(getenv("STATS_CACHE_TTL", "3600")),
+                                "stats")
+# Live rollup series (by (granularity, metric)) change with every event:
+# cached this long at most, should a relayed invalidation be late or lost
+STATS_LIVE_CACHE_TTL = float(getenv("STATS_LIVE_CACHE_TTL", "30"))
@@ -0,0 +1,188 @@
+"""Per-day user activity bitmaps and the DAU/WAU/MAU metrics."""
+from datetime import date, timedelta
+from os import getenv
+from typing import Iterable, List
+
+import numpy as np
+from bson import Int64
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from modules.cache import TTLCache
+from .models import User, CustomListing, CustomListingBid, Metric, \
+    ActivityBitmap, Sequence
+
+# Every bitmap is stored in chunks of WORDS_PER_CHUNK 64-bit words
+WORDS_PER_CHUNK = 512
+CHUNK_BITS = WORDS_PER_CHUNK * 64
+ROLES = ("supplier", "customer")
+# Metric name and the number of days its window covers
+WINDOWS = {"DAU": 1, "WAU": 7, "MAU": 30}
+
+# Dense activity index by user email
+index_cache = TTLCache(int(getenv("ACTIVITY_INDEX_CACHE_SIZE", "100000")),
+                       float(getenv("ACTIVITY_INDEX_CACHE_TTL", "86400")))
+# Bits already set by this worker: {(bitmap key, user index), ...}
+_recorded: set = set()
+_recorded_day: date | None = None
+
+
+def day_key(day: date) -> str:
+    """Get the bitmap key of a day."""
+    return day.isoformat()
+
+
+def role_key(role: str) -> str:
+    """Get the bitmap key of a role."""
+    return f"role:{role}"
+
+
+async def user_index(user_email: str) -> int | None:
+    """Get the user's dense activity index, allocating it on first use."""
+    index = index_cache.get(user_email)
+    if index is not None:
+        return index
+    user = await User.get_motor_collection().find_one(
+        {"email": user_email}, {"activityIndex": 1})
+    if user is None:
+        return None
+    index = user.get("activityIndex")
+    if index is None:
+        sequence = await Sequence.get_motor_collection().find_one_and_update(
+            {"name": "activityIndex"}, {"$inc": {"value": 1}},
+            upsert=True, return_document=ReturnDocument.AFTER)
+        user = await User.get_motor_collection().find_one_and_update(
+            {"email": user_email, "activityIndex": None},
+            {"$set": {"activityIndex": sequence["value"] - 1}},
+            projection={"activityIndex": 1},
+            return_document=ReturnDocument.AFTER)
+        if user is None:  # Allocated concurrently, the index is wasted
+            return await user_index(user_email)
+        index = user["activityIndex"]
+    index_cache.set(user_email, index)
+    return index
+
+
+async def set_bit(key: str, index: int):
+    """Set the user's bit in a bitmap."""
+    chunk, offset = divmod(index, CHUNK_BITS)
+    word, bit = divmod(offset, 64)
+    # Words are stored as signed 64-bit integers
+    mask = 1 << bit if bit < 63 else -(1 << 63)
+    collection = ActivityBitmap.get_motor_collection()
+    query = {"key": key, "chunk": chunk}
+    update = {"$bit": {f"words.{word}": {"or": Int64(mask)}}}
+    result = await collection.update_one(query, update)
+    if result.matched_count == 0:
+        try:
+            await collection.insert_one(
+                {**query, "words": [Int64(0)] * WORDS_PER_CHUNK})
+        except DuplicateKeyError:
+            pass
+        await collection.update_one(query, update)
+
+
+def forget_past_days():
+    """Drop the bits recorded by this worker on previous days."""
+    global _recorded_day
+    today = date.today()
+    if _recorded_day != today:
+        _recorded.clear()
+        _recorded_day = today
+
+
+async def record_bit(key: str, user_email: str):
+    """Set the user's bit in a bitmap once per worker and day."""
+    forget_past_days()
+    index = await user_index(user_email)
+    if index is None or (key, index) in _recorded:
+        return
+    await set_bit(key, index)
+    _recorded.add((key, index))
+
+
+async def record_activity(user_email: str):
+    """Mark the user as active today."""
+    await record_bit(day_key(date.today()), user_email)
+
+
+async def record_role(user_email: str, role: str):
+    """Mark the user as having acted as a supplier or a customer."""
+    await record_bit(role_key(role), user_email)
+
+
+async def load_bitmap(keys: Iterable[str]) -> np.ndarray:
+    """Load the union (OR) of bitmaps as an array of 64-bit words."""
+    documents = await (ActivityBitmap.get_motor_collection()
+                       .find({"key": {"$in": list(keys)}},
+                             {"_id": 0, "chunk": 1, "words": 1})
+                       .to_list(None))
+    chunks = max((document["chunk"] for document in documents), default=-1)
+    bitmap = np.zeros((chunks + 1, WORDS_PER_CHUNK), np.uint64)
+    for document in documents:
+        bitmap[document["chunk"]] |= (np.array(document["words"], np.int64)
+                                      .view(np.uint64))
+    return bitmap.ravel()
+
+
+def popcount(bitmap: np.ndarray) -> int:
+    """Count the set bits of a bitmap."""
+    return int(np.unpackbits(bitmap.view(np.uint8)).sum())
+
+
+def intersect(bitmap: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """AND two bitmaps of possibly different lengths."""
+    length = min(len(bitmap), len(mask))
+    return bitmap[:length] & mask[:length]
+
+
+async def compute_metrics(day: date | None = None) -> dict:
+    """Compute DAU/WAU/MAU of a day and write them into Metric.history.
+
+    Return the computed values by metric name and segment.
+    """
+    day = date.today() if day is None else day
+    masks = {role: await load_bitmap([role_key(role)]) for role in ROLES}
+    values = {}
+    for name, days in WINDOWS.items():
+        active = await load_bitmap(day_key(day - timedelta(days=offset))
+                                   for offset in range(days))
+        values[name] = {"all": popcount(active)}
+        for role, mask in masks.items():
+            values[name][role] = popcount(intersect(active, mask))
+    await write_metrics(day, values)
+    return values
+
+
+async def write_metrics(day: date, values: dict):
+    """Replace the day's point of every metric history segment."""
+    x = day_key(day)
+    updates: List[UpdateOne] = []
+    for name, segments in values.items():
+        updates.append(UpdateOne({"name": name}, [{"$set": {
+            f"history.{segment}": {"$concatArrays": [
+                {"$filter": {"input": {"$ifNull": [f"$history.{segment}",
+                                                   []]},
+                             "cond": {"$ne": ["$$this.x", x]}}},
+                [{"x": x, "y": value}]]}
+            for segment, value in segments.items()}}], upsert=True))
+    await Metric.get_motor_collection().bulk_write(updates, ordered=False)
+
+
+async def backfill_roles() -> dict:
+    """Mark the roles of users who already bid or created listings.
+
+    Return the number of users per role.
+    """
+    sources = {"supplier": (CustomListingBid, "bidderInn"),
+               "customer": (CustomListing, "companyInn")}
+    marked = {}
+    for role, (model, field) in sources.items():
+        inns = await model.get_motor_collection().distinct(field)
+        users = User.get_motor_collection().find(
+            {"companyInn": {"$in": inns}}, {"email": 1})
+        marked[role] = 0
+        async for user in users:
+            await record_role(user["email"], role)
+            marked[role] += 1
+    return marked
@@ -0,0 +1,106 @@
+"""MongoDB client lifecycle, pool settings and read preferences."""
+import asyncio
+from os import getenv
+from time import perf_counter
+from typing import Type
+
+from beanie import Document
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, \
+    AsyncIOMotorDatabase
+from pymongo.read_preferences import make_read_preference, \
+    read_pref_mode_from_name
+
+
+def _optional_int(name: str) -> int | None:
+    """Read an optional integer setting, empty means the driver default."""
+    value = getenv(name, "")
+    return int(value) if value else None
+
+
+# Connection pool of every process (per uvicorn worker)
+MAX_POOL_SIZE = int(getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MIN_POOL_SIZE = int(getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MAX_CONNECTING = int(getenv("MONGODB_MAX_CONNECTING", "2"))
+MAX_IDLE_TIME_MS = _optional_int("MONGODB_MAX_IDLE_TIME_MS")
+# Timeouts, in milliseconds
+WAIT_QUEUE_TIMEOUT_MS = _optional_int("MONGODB_WAIT_QUEUE_TIMEOUT_MS")
+CONNECT_TIMEOUT_MS = int(getenv("MONGODB_CONNECT_TIMEOUT_MS", "10000"))
+SOCKET_TIMEOUT_MS = _optional_int("MONGODB_SOCKET_TIMEOUT_MS")
+SERVER_SELECTION_TIMEOUT_MS = \
+    int(getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+# Comma-separated wire compressors (zlib, snappy, zstd), empty disables
+COMPRESSORS = getenv("MONGODB_COMPRESSORS", "")
+# Read preference of the read-only endpoints (listings, stats, resolve)
+READ_PREFERENCE = make_read_preference(
+    read_pref_mode_from_name(getenv("MONGODB_READ_PREFERENCE",
+                                    "secondaryPreferred")),
+    None,
+    int(getenv("MONGODB_MAX_STALENESS", "-1")))
+
+DATABASE_NAME = "rlt_hack"
+
+_client: AsyncIOMotorClient | None = None
+
+
+def client_options() -> dict:
+    """Get the pool, timeout and compression options of the client."""
+    options = {"maxPoolSize": MAX_POOL_SIZE,
+               "minPoolSize": MIN_POOL_SIZE,
+               "maxConnecting": MAX_CONNECTING,
+               "maxIdleTimeMS": MAX_IDLE_TIME_MS,
+               "waitQueueTimeoutMS": WAIT_QUEUE_TIMEOUT_MS,
+               "connectTimeoutMS": CONNECT_TIMEOUT_MS,
+               "socketTimeoutMS": SOCKET_TIMEOUT_MS,
+               "serverSelectionTimeoutMS": SERVER_SELECTION_TIMEOUT_MS}
+    if COMPRESSORS:
+        options["compressors"] = COMPRESSORS
+    return options
+
+
+def connect(url: str) -> AsyncIOMotorClient:
+    """Create the client of this process, replacing the previous one."""
+    global _client
+    close()
+    _client = AsyncIOMotorClient(url, **client_options())
+    return _client
+
+
+def close():
+    """Close the client of this process and its pooled connections."""
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+def get_database() -> AsyncIOMotorDatabase:
+    """Get the database of the connected client.
+
+    Raise RuntimeError if the client is not connected.
+    """
+    if _client is None:
+        raise RuntimeError("Database client is not connected")
+    return _client[DATABASE_NAME]
+
+
+async def ping() -> float:
+    """Ping the server, return the round trip in milliseconds.
+
+    Raise RuntimeError if the client is not connected.
+    """
+    if _client is None:
+        raise RuntimeError("Database client is not connected")
+    started = perf_counter()
+    await _client.admin.command("ping")
+    return (perf_counter() - started) * 1000
+
+
+async def warm_up():
+    """Open `MIN_POOL_SIZE` (at least one) pooled connections up front."""
+    await asyncio.gather(*(ping() for _ in range(max(MIN_POOL_SIZE, 1))))
+
+
+def read_collection(model: Type[Document]) -> AsyncIOMotorCollection:
+    """Get the collection of a model for reads that tolerate staleness."""
+    return (model.get_motor_collection()
+            .with_options(read_preference=READ_PREFERENCE))
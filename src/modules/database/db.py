@@ -1,28 +1,95 @@
 """SQLAlchemy database management."""
 
-from typing import Optional, List
+import asyncio
+import json
+import logging
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from os import getenv
+from typing import Optional, List, Tuple, AsyncIterator, Dict, Iterable
+from modules.cache import user_cache, stats_response_cache, \
+    catalogue_cache, company_cache, UNKNOWN_COMPANY
+from modules.events import broker
 from .models import User, CustomListing, CustomListingBid, \
     UserAchievements, Metric, TaskGoal, Task, Script, \
-    StatisticsProto
+    StatisticsProto, StatisticsSeries, StatisticsCounter, ActivityBitmap, \
+    Sequence, Lease, UNIQUE_BID_INDEX
+from . import rollup, activity, connection, search
 # from .models import Achievement
-from motor.motor_asyncio import AsyncIOMotorClient
 # from pydantic import BaseModel
 from beanie import init_beanie  # Document, Indexed,
 from beanie.odm.enums import SortDirection
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne, InsertOne, DeleteOne, ReturnDocument
+from pymongo.errors import PyMongoError, DuplicateKeyError, \
+    BulkWriteError
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+# Page size of the paginated list queries
+PAGE_SIZE = int(getenv("PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(getenv("MAX_PAGE_SIZE", "1000"))
+# Documents fetched per round trip by the streaming exports
+EXPORT_BATCH_SIZE = int(getenv("EXPORT_BATCH_SIZE", "1000"))
+# Listings inserted per round trip by the bulk imports
+IMPORT_BATCH_SIZE = int(getenv("IMPORT_BATCH_SIZE", "1000"))
+
+# Query shapes of the hot lookups; every one of them must be index-backed
+HOT_QUERIES = [
+    (User, {"email": ""}, None),
+    (User, {"companyInn": 0}, None),
+    (CustomListing, {"trackingId": 0, "lot": 0}, None),
+    (CustomListing, {"companyInn": 0}, [("_id", 1)]),
+    (CustomListing, {"companyInn": 0, "isActive": True}, [("_id", 1)]),
+    (CustomListing, {"isActive": True}, [("_id", 1)]),
+    (CustomListing, {"winnerInn": 0}, None),
+    (CustomListing, {"searchTerms": {"$all": [""]}}, None),
+    (CustomListing, {"isActive": True, "tsEnd": {"$lte": datetime.min}},
+     [("tsEnd", 1)]),
+    (CustomListingBid, {"listingTrackingId": 0, "listingLot": 0},
+     [("bidPrice", 1), ("_id", 1)]),
+    (CustomListingBid, {"listingTrackingId": 0, "listingLot": 0,
+                        "bidderInn": 0}, None),
+    (StatisticsSeries, {"granularity": "daily", "pid": 0}, None),
+]
+
+# Statistics granularities, in the order of the legacy StatisticsProto
+STATISTICS_GRANULARITIES = ("daily", "monthly", "yearly")
+
 
 async def init_db(mongodb_user: str,
                   mongodb_pass: str,
                   mongodb_host: str,
-                  mongodb_port: str):
+                  mongodb_port: str,
+                  dedupe_bids: bool = False):
     """Initialize the database manager.
 
-    Pass MongoDB Credentials to initialize this manager.
+    Pass MongoDB Credentials to initialize this manager. The unique bid
+    index cannot be built over duplicate bids: they are dropped with
+    `dedupe_bids` (`manage.py dedupe-bids`), else RuntimeError is raised,
+    as it is for duplicate user emails and listing tracking IDs and lots.
     """
-    client = AsyncIOMotorClient(f"mongodb://{mongodb_user}:\
+    connection.connect(f"mongodb://{mongodb_user}:\
 {mongodb_pass}@{mongodb_host}:{mongodb_port}")
-    await init_beanie(database=client.rlt_hack,
+    # Beanie names the collections after their models
+    database = connection.get_database()
+    for model, key in ((User, {"email": "$email"}),
+                       (CustomListing, {"trackingId": "$trackingId",
+                                        "lot": "$lot"})):
+        await _check_unique(database[model.__name__], key)
+    bids = database[CustomListingBid.__name__]
+    deduplicated: List[Tuple[int, int]] = []
+    if UNIQUE_BID_INDEX not in await bids.index_information():
+        duplicates = await _find_duplicates(
+            bids, {"trackingId": "$listingTrackingId",
+                   "lot": "$listingLot",
+                   "inn": "$bidderInn"}, "ts")
+        if duplicates and not dedupe_bids:
+            raise RuntimeError("Duplicate bids prevent the unique bid "
+                               "index, run `manage.py dedupe-bids`")
+        deduplicated = await _drop_duplicate_bids(bids, duplicates)
+    await init_beanie(database=connection.get_database(),
                       document_models=[User,
                                        UserAchievements,
                                        CustomListing,
@@ -31,7 +98,120 @@ async def init_db(mongodb_user: str,
                                        TaskGoal,
                                        Task,
                                        Script,
-                                       StatisticsProto])  # type: ignore
+                                       StatisticsProto,
+                                       StatisticsSeries,
+                                       StatisticsCounter,
+                                       ActivityBitmap,
+                                       Sequence,
+                                       Lease])  # type: ignore
+    for listing_tracking_id, listing_lot in deduplicated:
+        await sync_bid_state(listing_tracking_id, listing_lot)
+    # init_beanie builds the declared indexes, make sure they are used
+    for collection in await verify_indexes():
+        logger.warning("Hot queries on '%s' fall back to COLLSCAN",
+                       collection)
+
+
+async def _find_duplicates(collection, key: dict, order: str = "_id"
+                           ) -> List[dict]:
+    """Group the documents sharing the same key, earliest first.
+
+    Return only the groups of more than one document.
+    """
+    return await collection.aggregate([
+        {"$sort": {order: 1}},
+        {"$group": {"_id": key, "ids": {"$push": "$_id"}}},
+        {"$match": {"ids.1": {"$exists": True}}},
+    ], allowDiskUse=True).to_list(None)
+
+
+async def _check_unique(collection, key: dict):
+    """Refuse to start while duplicates prevent a unique index on key.
+
+    Duplicate users and listings cannot be dropped automatically: they
+    are logged so that they can be merged or removed by hand.
+    """
+    name = "_".join(f"{field}_1" for field in key)
+    if name in await collection.index_information():
+        return
+    duplicates = await _find_duplicates(collection, key)
+    for duplicate in duplicates:
+        logger.error("Duplicate %s %s: %s", collection.name,
+                     duplicate["_id"],
+                     ", ".join(map(str, duplicate["ids"])))
+    if duplicates:
+        raise RuntimeError(f"Duplicate {collection.name} documents "
+                           f"prevent the unique index {name}, remove "
+                           "the logged ones before starting")
+
+
+async def _drop_duplicate_bids(collection, duplicates: List[dict]
+                               ) -> List[Tuple[int, int]]:
+    """Keep only the earliest bid of every group of duplicate bids.
+
+    Return the (trackingId, lot) of the listings that lost bids.
+    """
+    for duplicate in duplicates:
+        logger.warning("Dropping duplicate bids %s of company %s on "
+                       "listing %s/%s, keeping %s",
+                       ", ".join(map(str, duplicate["ids"][1:])),
+                       duplicate["_id"]["inn"],
+                       duplicate["_id"]["trackingId"],
+                       duplicate["_id"]["lot"],
+                       duplicate["ids"][0])
+    if duplicates:
+        await collection.delete_many(
+            {"_id": {"$in": [bid_id for duplicate in duplicates
+                             for bid_id in duplicate["ids"][1:]]}})
+    return [(duplicate["_id"]["trackingId"], duplicate["_id"]["lot"])
+            for duplicate in duplicates]
+
+
+def _plan_stages(plan: dict) -> List[str]:
+    """Flatten the stage names of an explained query plan."""
+    stages = [plan.get("stage", "")]
+    if "inputStage" in plan:
+        stages += _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+
+async def verify_indexes() -> List[str]:
+    """Explain the hot queries, return collections that do COLLSCAN."""
+    collscans: List[str] = []
+    for model, query, sort in HOT_QUERIES:
+        collection = model.get_motor_collection()
+        cursor = collection.find(query).limit(1)
+        if sort is not None:
+            cursor = cursor.sort(sort)
+        explained = await cursor.explain()
+        winning_plan = explained["queryPlanner"]["winningPlan"]
+        # Newer servers wrap the plan into `queryPlan`
+        winning_plan = winning_plan.get("queryPlan", winning_plan)
+        if ("COLLSCAN" in _plan_stages(winning_plan)
+                and collection.name not in collscans):
+            collscans.append(collection.name)
+    return collscans
+
+
+def close_db():
+    """Close the database client and its connection pool."""
+    connection.close()
+
+
+async def warm_up_db():
+    """Open the connection pool and preload the catalogues."""
+    await connection.warm_up()
+    await get_all_scripts()
+    await get_all_tasks()
+
+
+async def ping_db() -> dict:
+    """Check the database connection, raise PyMongoError if it is down."""
+    return {"latencyMs": round(await connection.ping(), 3),
+            "maxPoolSize": connection.MAX_POOL_SIZE,
+            "readPreference": connection.READ_PREFERENCE.mongos_mode}
 
 
 async def is_user(user_email: str) -> bool:
@@ -77,7 +257,11 @@ async def add_user(email: str,
                 city=city,
                 companyInn=None,
                 companyName=None)
-    await User.insert_one(user)
+    try:
+        await User.insert_one(user)
+    except DuplicateKeyError:
+        raise KeyError("User already exists")
+    await rollup.record_event("signups")
 
 
 async def get_user(user_email: str) -> User | None:
@@ -98,54 +282,72 @@ async def update_user_password(user_email: str, password_hash: str):
     """Update the user password in the database."""
     await (User.find_one(User.email == user_email)
            .set({User.passwordHash: password_hash}))
+    user_cache.invalidate(user_email)
 
 
 async def update_user_email(user_email: str, new_email: str):
     """Update the user's email in the database."""
     await (User.find_one(User.email == user_email)
            .set({User.email: new_email}))
+    user_cache.invalidate(user_email)
 
 
 async def update_user_first_name(user_email: str, name: str):
     """Update the user's name in the database."""
     await (User.find_one(User.email == user_email)
            .set({User.firstName: name}))
+    user_cache.invalidate(user_email)
 
 
 async def update_user_last_name(user_email: str, surname: str):
     """Update the user's surname in the database."""
     await (User.find_one(User.email == user_email)
            .set({User.lastName: surname}))
+    user_cache.invalidate(user_email)
 
 
 async def update_user_phone_number(user_email: str, phone_number: int):
     """Update the user's phone number in the database."""
     await (User.find_one(User.email == user_email)
            .set({User.phoneNumber: phone_number}))  # type: ignore
+    user_cache.invalidate(user_email)
 
 
 async def update_user_country(user_email: str, country: str | None):
     """Update the user's country in the database."""
     await (User.find_one(User.email == user_email)
            .set({User.country: country}))  # type: ignore
+    user_cache.invalidate(user_email)
 
 
 async def update_user_city(user_email: str, city: str | None):
     """Update the user's city in the database."""
     await (User.find_one(User.email == user_email)
            .set({User.city: city}))  # type: ignore
+    user_cache.invalidate(user_email)
 
 
 async def set_user_company_name(user_email: str, company_name: str | None):
     """Set user's company name in the database."""
-    await (User.find_one(User.email == user_email)
-           .set({User.companyName: company_name}))  # type: ignore
+    user = await User.get_motor_collection().find_one_and_update(
+        {"email": user_email},
+        {"$set": {"companyName": company_name}},
+        projection={"_id": 0, "companyInn": 1})
+    user_cache.invalidate(user_email)
+    if user is not None:
+        company_cache.invalidate(user.get("companyInn"))
 
 
 async def set_user_company_inn(user_email: str, company_inn: int | None):
     """Set user's company INN in the database."""
-    await (User.find_one(User.email == user_email)
-           .set({User.companyInn: company_inn}))  # type: ignore
+    user = await User.get_motor_collection().find_one_and_update(
+        {"email": user_email},
+        {"$set": {"companyInn": company_inn}},
+        projection={"_id": 0, "companyInn": 1})
+    user_cache.invalidate(user_email)
+    company_cache.invalidate(company_inn)
+    if user is not None:
+        company_cache.invalidate(user.get("companyInn"))
 
 
 async def get_user_company(user_email: str) -> dict:
@@ -157,12 +359,55 @@ async def get_user_company(user_email: str) -> dict:
             "inn": user.companyInn}
 
 
+async def get_company_inn(user_email: str) -> int | None:
+    """Get the INN of the user's company with a projected read."""
+    user = await User.get_motor_collection().find_one(
+        {"email": user_email}, {"_id": 0, "companyInn": 1})
+    if user is None:
+        raise ValueError("User does not exist")
+    return user.get("companyInn")
+
+
+_NOT_CACHED = object()
+
+
+async def get_company_names_by_inn(company_inns: Iterable[int]
+                                   ) -> Dict[int, str | None]:
+    """Get the names of the companies with these INNs.
+
+    Cached INNs are answered from memory, the others with one $in query
+    on the primary: a lagging secondary would re-cache a name or unknown
+    INN that was just invalidated. Unknown INNs are left out.
+    """
+    names: Dict[int, object] = {}
+    missing = []
+    for company_inn in set(company_inns):
+        name = company_cache.get(company_inn, _NOT_CACHED)
+        if name is _NOT_CACHED:
+            missing.append(company_inn)
+        else:
+            names[company_inn] = name
+    if missing:
+        companies = await (User.get_motor_collection()
+                           .find({"companyInn": {"$in": missing}},
+                                 {"_id": 0, "companyInn": 1,
+                                  "companyName": 1})
+                           .to_list(None))
+        for company in companies:
+            names[company["companyInn"]] = company.get("companyName")
+        for company_inn in missing:
+            company_cache.set(company_inn, names.get(company_inn,
+                                                     UNKNOWN_COMPANY))
+    return {company_inn: name for company_inn, name in names.items()
+            if name is not UNKNOWN_COMPANY}
+
+
 async def get_company_name_by_inn(company_inn: int) -> str | None:
     """Get company name by its INN."""
-    company = await User.find_one(User.companyInn == company_inn)
-    if company is None:
+    names = await get_company_names_by_inn([company_inn])
+    if company_inn not in names:
         raise ValueError("Company not found")
-    return company.companyName
+    return names[company_inn]
 
 
 # region Custom Listings
@@ -210,8 +455,77 @@ async def create_custom_listing(user_email: str,
                             basePrice=base_price,
                             dynamic=0,
                             isActive=True,
-                            tsEnd=ts_end)
-    await CustomListing.insert_one(listing)
+                            tsEnd=ts_end,
+                            searchTerms=search.search_terms(name,
+                                                            description))
+    try:
+        await CustomListing.insert_one(listing)
+    except DuplicateKeyError:
+        raise KeyError("Listing already exists")
+    await rollup.record_event("listings", listing.tsBegin)
+    await activity.record_role(user_email, "customer")
+
+
+async def _insert_custom_listings(batch: List[Tuple[int, dict]]
+                                  ) -> Tuple[int, List[int]]:
+    """Insert a batch of Custom Listing documents in any order.
+
+    Return the number of inserted listings and the rows of duplicates.
+    """
+    try:
+        result = await CustomListing.get_motor_collection().insert_many(
+            [document for _, document in batch], ordered=False)
+    except BulkWriteError as error:
+        duplicates = []
+        for write_error in error.details["writeErrors"]:
+            if write_error["code"] != 11000:
+                raise
+            duplicates.append(batch[write_error["index"]][0])
+        return error.details["nInserted"], duplicates
+    return len(result.inserted_ids), []
+
+
+async def import_custom_listings(user_email: str,
+                                 listings: AsyncIterator[Tuple[int, dict]],
+                                 batch_size: int = IMPORT_BATCH_SIZE
+                                 ) -> Tuple[int, List[int]]:
+    """Create Custom Listings of the user's company from (row, fields).
+
+    The fields are those of create_custom_listing (basePrice, tsEnd).
+    The company is resolved once and the listings are inserted in
+    unordered batches; the unique (trackingId, lot) index rejects the
+    existing ones. Return the number of created listings and the rows of
+    the rejected ones.
+    """
+    company_inn = await get_company_inn(user_email)
+    if company_inn is None:
+        raise ValueError("User has no INN")
+    inserted = 0
+    duplicates: List[int] = []
+    batch: List[Tuple[int, dict]] = []
+    async for row, fields in listings:
+        listing = CustomListing(companyInn=company_inn,
+                                dynamic=0,
+                                isActive=True,
+                                searchTerms=search.search_terms(
+                                    fields["name"], fields["description"]),
+                                **fields)
+        batch.append((row, listing.dict(exclude={"id", "revision_id"})))
+        if len(batch) >= batch_size:
+            batch_inserted, batch_duplicates = \
+                await _insert_custom_listings(batch)
+            inserted += batch_inserted
+            duplicates += batch_duplicates
+            batch = []
+    if batch:
+        batch_inserted, batch_duplicates = \
+            await _insert_custom_listings(batch)
+        inserted += batch_inserted
+        duplicates += batch_duplicates
+    if inserted:
+        await rollup.record_event("listings", count=inserted)
+        await activity.record_role(user_email, "customer")
+    return inserted, duplicates
 
 
 async def mut_custom_listing_is_active(user_email: str,
@@ -228,13 +542,8 @@ async def mut_custom_listing_is_active(user_email: str,
 
 
 async def get_custom_listing(listing_tracking_id: int,
-                             lot: int,
-                             set_bid_dynamics: bool
-                             = True) -> CustomListing | None:
+                             lot: int) -> CustomListing | None:
     """Get a specific Custom Listing."""
-    if set_bid_dynamics:
-        await set_bid_dynamic(listing_tracking_id, lot,
-                              await get_bid_dynamic(listing_tracking_id, lot))
     listing = await CustomListing.find_one(CustomListing.trackingId
                                            == listing_tracking_id,
                                            CustomListing.lot == lot)
@@ -243,26 +552,218 @@ async def get_custom_listing(listing_tracking_id: int,
     return listing
 
 
+def _page_size(limit: int | None) -> int:
+    """Clamp the requested page size to the configured bounds."""
+    if limit is None:
+        return PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def _encode_cursor(key: dict) -> str:
+    """Encode a keyset position into an opaque cursor."""
+    return urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> dict:
+    """Decode an opaque cursor into a keyset position."""
+    try:
+        key = json.loads(urlsafe_b64decode(cursor.encode()))
+        key["id"] = ObjectId(key["id"])
+    except (ValueError, TypeError, KeyError, InvalidId):
+        raise ValueError("Malformed cursor")
+    return key
+
+
+async def _find_custom_listings_page(query: dict,
+                                     limit: int | None,
+                                     cursor: str | None,
+                                     fields: List[str] | None
+                                     ) -> Tuple[List[dict], str | None]:
+    """Get a page of Custom Listings ordered by _id.
+
+    Return the raw documents (projected to `fields` if given) and the
+    cursor of the next page (None on the last page).
+    """
+    limit = _page_size(limit)
+    if cursor is not None:
+        query = {**query, "_id": {"$gt": _decode_cursor(cursor)["id"]}}
+    projection = None if fields is None else dict.fromkeys(fields, 1)
+    documents = await (connection.read_collection(CustomListing)
+                       .find(query, projection)
+                       .sort("_id", 1)
+                       .limit(limit + 1)
+                       .to_list(None))
+    if len(documents) <= limit:
+        return documents, None
+    documents = documents[:limit]
+    return documents, _encode_cursor({"id": str(documents[-1]["_id"])})
+
+
 async def get_all_custom_listings(active: bool | None = None,
-                                  set_bid_dynamics: bool = True):
-    """Get all Custom Listings (all or active/!active)."""
-    if set_bid_dynamics:
-        await set_all_bid_dynamics()
-    if active is None:
-        return await CustomListing.find_many().to_list()
-    return await (CustomListing.find(CustomListing.isActive == active)
-                  .to_list(None))
+                                  limit: int | None = None,
+                                  cursor: str | None = None,
+                                  fields: List[str] | None = None
+                                  ) -> Tuple[List[dict], str | None]:
+    """Get a page of Custom Listings (all or active/!active)."""
+    query = {} if active is None else {"isActive": active}
+    return await _find_custom_listings_page(query, limit, cursor, fields)
 
 
 async def get_all_custom_listings_by_company(inn: int,
-                                             active: bool | None = None):
-    """Get all Custom Listings by company (all or active/!active)."""
-    if active is None:
-        return await CustomListing.find_many(CustomListing
-                                             .companyInn == inn).to_list()
-    return await (CustomListing
-                  .find(CustomListing.companyInn == inn,
-                        CustomListing.isActive == active)).to_list()
+                                             active: bool | None = None,
+                                             limit: int | None = None,
+                                             cursor: str | None = None,
+                                             fields: List[str] | None = None
+                                             ) -> Tuple[List[dict],
+                                                        str | None]:
+    """Get a page of Custom Listings by company (all or active/!active)."""
+    query: dict = {"companyInn": inn}
+    if active is not None:
+        query["isActive"] = active
+    return await _find_custom_listings_page(query, limit, cursor, fields)
+
+
+# Bid summary of a Custom Listing carried by its live events
+_BID_SUMMARY_FIELDS = {"_id": 0, "bidCount": 1, "lowestBid": 1,
+                       "latestBid": 1, "dynamic": 1}
+
+
+def _open_listing_filter(listing_tracking_id: int,
+                         listing_lot: int,
+                         now: datetime) -> dict:
+    """Match a Custom Listing that still accepts bids."""
+    return {"trackingId": listing_tracking_id,
+            "lot": listing_lot,
+            "isActive": True,
+            "tsEnd": {"$gt": now}}
+
+
+def _bid_summary_update(bid: CustomListingBid) -> list:
+    """Build the pipeline update folding a new bid into the summary.
+
+    Listings created before the summary existed are left without it:
+    they have to be resynced from their bids (see repair_bid_state).
+    """
+    unsummarized = {"$eq": [{"$type": "$bidCount"}, "missing"]}
+    fields = {
+        "bidCount": {"$add": ["$bidCount", 1]},
+        "lowestBid": {"$min": [bid.bidPrice, "$lowestBid"]},
+        "latestBid": {"$cond": [{"$gte": [bid.ts, "$latestBidTs"]},
+                                bid.bidPrice, "$latestBid"]},
+        "latestBidTs": {"$max": [bid.ts, "$latestBidTs"]}}
+    return [{"$set": {field: {"$cond": [unsummarized, "$$REMOVE", value]}
+                      for field, value in fields.items()}},
+            {"$set": {"dynamic": {"$cond": [unsummarized, "$dynamic",
+                                            _DYNAMIC_EXPRESSION]}}}]
+
+
+def _bid_delta(bid: CustomListingBid) -> dict:
+    """Get the fields of a bid carried by the live events."""
+    return {"bidderInn": bid.bidderInn,
+            "bidPrice": bid.bidPrice,
+            "ts": bid.ts}
+
+
+async def publish_listing_event(listing_tracking_id: int,
+                                listing_lot: int,
+                                event: dict):
+    """Push an event to the live subscribers of a Custom Listing.
+
+    The write it reports is done, so a failed push is only logged.
+    """
+    try:
+        await broker.publish((listing_tracking_id, listing_lot),
+                             {"trackingId": listing_tracking_id,
+                              "lot": listing_lot,
+                              **event})
+    except PyMongoError:
+        logger.exception("Could not publish a Custom Listing event")
+
+
+async def publish_listing_events(events: Iterable[Tuple[int, int, dict]]):
+    """Push (trackingId, lot, event) triples to the live subscribers.
+
+    All are sent in one write, a failed push is only logged.
+    """
+    try:
+        await broker.publish_many(
+            ((listing_tracking_id, listing_lot),
+             {"trackingId": listing_tracking_id,
+              "lot": listing_lot,
+              **event})
+            for listing_tracking_id, listing_lot, event in events)
+    except PyMongoError:
+        logger.exception("Could not publish Custom Listing events")
+
+
+async def search_custom_listings(query: str,
+                                 active: bool | None = None,
+                                 kind: str | None = None,
+                                 limit: int | None = None,
+                                 cursor: str | None = None,
+                                 fields: List[str] | None = None
+                                 ) -> Tuple[List[dict], str | None]:
+    """Get a page of Custom Listings matching every word of a query.
+
+    Words match in any inflection, the last one also as a prefix while
+    it is typed. Listings are ranked by relevance (name matches first),
+    then by _id. Raise ValueError if the query has no words.
+    """
+    stems, partial = search.parse_query(query)
+    if not stems and partial is None:
+        raise ValueError("Empty search query")
+    limit = _page_size(limit)
+    match = search.term_filter(stems, partial)
+    if active is not None:
+        match["isActive"] = active
+    if kind is not None:
+        match["kind"] = kind
+    pipeline: List[dict] = [
+        {"$match": match},
+        {"$addFields": {"score": search.score_expression(stems, partial)}},
+    ]
+    if cursor is not None:
+        position = _decode_cursor(cursor)
+        if not isinstance(position.get("score"), (int, float)):
+            raise ValueError("Malformed cursor")
+        pipeline.append({"$match": {"$or": [
+            {"score": {"$lt": position.get("score")}},
+            {"score": position.get("score"),
+             "_id": {"$gt": position["id"]}}]}})
+    pipeline += [
+        {"$sort": {"score": -1, "_id": 1}},
+        {"$limit": limit + 1},
+        {"$project": {"searchTerms": 0} if fields is None
+         else {**dict.fromkeys(fields, 1), "score": 1}},
+    ]
+    documents = await (connection.read_collection(CustomListing)
+                       .aggregate(pipeline)
+                       .to_list(None))
+    if len(documents) <= limit:
+        return documents, None
+    documents = documents[:limit]
+    return documents, _encode_cursor({"score": documents[-1]["score"],
+                                      "id": str(documents[-1]["_id"])})
+
+
+async def backfill_search_terms(batch_size: int = 1000) -> int:
+    """Compute the search terms of the listings created without them."""
+    collection = CustomListing.get_motor_collection()
+    updated = 0
+    while True:
+        batch = await (collection.find({"searchTerms": {"$exists": False}},
+                                       {"name": 1, "description": 1})
+                       .limit(batch_size)
+                       .to_list(None))
+        if not batch:
+            return updated
+        await collection.bulk_write([
+            UpdateOne({"_id": listing["_id"]},
+                      {"$set": {"searchTerms": search.search_terms(
+                          listing.get("name", ""),
+                          listing.get("description"))}})
+            for listing in batch], ordered=False)
+        updated += len(batch)
 
 
 async def bid_exists(user_email: str,
@@ -280,105 +781,361 @@ async def place_bid(user_email: str,
                     listing_tracking_id: int,
                     listing_lot: int,
                     bid_price: float):
-    """Place bid on a Custom Listing."""
-    if await bid_exists(user_email, listing_tracking_id, listing_lot):
-        raise ValueError("Bid already exists")
-    bidder_inn = (await get_user_company(user_email))["inn"]
+    """Place bid on a Custom Listing.
+
+    The unique bid index rejects a second bid of the company (ValueError).
+    The listing must be active and before its tsEnd: otherwise the bid
+    is taken back and PermissionError (KeyError if the listing does not
+    exist) is raised.
+    """
     bid = CustomListingBid(listingTrackingId=listing_tracking_id,
                            listingLot=listing_lot,
-                           bidderInn=bidder_inn,
+                           bidderInn=await get_company_inn(user_email),
                            bidPrice=bid_price)
-    await CustomListingBid.insert_one(bid)
+    try:
+        await CustomListingBid.insert_one(bid)
+    except DuplicateKeyError:
+        raise ValueError("Bid already exists")
+    # Fold the new bid into the summary of the open listing in one update
+    summary = await CustomListing.get_motor_collection().find_one_and_update(
+        _open_listing_filter(listing_tracking_id, listing_lot,
+                             datetime.utcnow()),
+        _bid_summary_update(bid),
+        projection=_BID_SUMMARY_FIELDS,
+        return_document=ReturnDocument.AFTER)
+    bids = CustomListingBid.get_motor_collection()
+    if summary is None:
+        deleted = await bids.delete_one({"_id": bid.id})
+        if not deleted.deleted_count:
+            # Withdrawn meanwhile, maybe counted out of a summary without it
+            await sync_bid_state(listing_tracking_id, listing_lot)
+        if not await custom_listing_exists(listing_tracking_id,
+                                           listing_lot):
+            raise KeyError("Custom listing does not exist")
+        raise PermissionError("Custom listing is closed")
+    # A withdrawal between the insert and the update ran on a summary
+    # without the bid, which the update then added: rebuild it
+    if "bidCount" not in summary \
+            or await bids.find_one({"_id": bid.id}, {"_id": 1}) is None:
+        # Also builds the summary of listings that predate it
+        await sync_bid_state(listing_tracking_id, listing_lot)
+        summary = await CustomListing.get_motor_collection().find_one(
+            {"trackingId": listing_tracking_id, "lot": listing_lot},
+            _BID_SUMMARY_FIELDS)
+    await publish_listing_event(listing_tracking_id, listing_lot,
+                                {"type": "bid_placed",
+                                 "bid": _bid_delta(bid),
+                                 "listing": summary})
+    await rollup.record_event("bids", bid.ts)
+    await activity.record_role(user_email, "supplier")
 
 
 async def withdraw_bid(user_email: str,
                        listing_tracking_id: int,
                        listing_lot: int):
     """Withdraw bid from a Custom Listing."""
-    if not await bid_exists(user_email, listing_tracking_id, listing_lot):
+    document = await CustomListingBid.get_motor_collection() \
+        .find_one_and_delete(
+            {"listingTrackingId": listing_tracking_id,
+             "listingLot": listing_lot,
+             "bidderInn": await get_company_inn(user_email)})
+    if document is None:
         raise ValueError("Bid does not exist")
-    bidder_inn = (await get_user_company(user_email))["inn"]
-    bid = await CustomListingBid.find_one(
-        CustomListingBid.listingTrackingId == listing_tracking_id,
-        CustomListingBid.listingLot == listing_lot,
-        CustomListingBid.bidderInn == bidder_inn)
-    if bid is not None:
-        await CustomListingBid.delete(bid)
+    bid = CustomListingBid.parse_obj(document)
+    collection = CustomListing.get_motor_collection()
+    # Neither the lowest nor the latest bid was withdrawn: only decrement
+    summary = await collection.find_one_and_update(
+        {"trackingId": listing_tracking_id,
+         "lot": listing_lot,
+         "lowestBid": {"$lt": bid.bidPrice},
+         "latestBidTs": {"$gt": bid.ts}},
+        {"$inc": {"bidCount": -1}},
+        projection=_BID_SUMMARY_FIELDS,
+        return_document=ReturnDocument.AFTER)
+    if summary is None:
+        await sync_bid_state(listing_tracking_id, listing_lot)
+        summary = await collection.find_one(
+            {"trackingId": listing_tracking_id, "lot": listing_lot},
+            _BID_SUMMARY_FIELDS)
+    await publish_listing_event(listing_tracking_id, listing_lot,
+                                {"type": "bid_withdrawn",
+                                 "bid": _bid_delta(bid),
+                                 "listing": summary})
+
+
+async def apply_bid_operations(user_email: str,
+                               operations: List[Tuple[int, int,
+                                                      float | None]]
+                               ) -> List[Exception | None]:
+    """Place (with a price) or withdraw (None) bids of the user's company.
+
+    Every operation must target a different (trackingId, lot). The bids
+    are written in one bulk write; like in place_bid, every placed bid
+    is then folded into its listing only if the listing is still open
+    (concurrently, one update per listing), else it is taken back. The
+    listings of withdrawn bids are resynced in one aggregation and the
+    live events are published in one write. Return None for every
+    applied operation, else the exception place_bid or withdraw_bid
+    would have raised.
+    """
+    bidder_inn = await get_company_inn(user_email)
+    now = datetime.utcnow()
+    results: List[Exception | None] = [None] * len(operations)
+    keys = [(tracking_id, lot) for tracking_id, lot, _ in operations]
+    listings = {
+        (listing["trackingId"], listing["lot"]): listing
+        for listing in await CustomListing.get_motor_collection().find(
+            {"$or": [{"trackingId": tracking_id, "lot": lot}
+                     for tracking_id, lot in keys]},
+            {"_id": 0, "trackingId": 1, "lot": 1,
+             "isActive": 1, "tsEnd": 1}).to_list(None)}
+    bids = {
+        (bid["listingTrackingId"], bid["listingLot"]): bid
+        for bid in await CustomListingBid.get_motor_collection().find(
+            {"bidderInn": bidder_inn,
+             "$or": [{"listingTrackingId": tracking_id, "listingLot": lot}
+                     for tracking_id, lot in keys]}).to_list(None)}
+
+    requests: list = []
+    request_indices: List[int] = []
+    for index, (tracking_id, lot, price) in enumerate(operations):
+        listing = listings.get((tracking_id, lot))
+        bid = bids.get((tracking_id, lot))
+        if price is None:
+            if bid is None:
+                results[index] = ValueError("Bid does not exist")
+                continue
+            requests.append(DeleteOne({"_id": bid["_id"]}))
+        elif listing is None:
+            results[index] = KeyError("Custom listing does not exist")
+            continue
+        elif not listing["isActive"] or listing["tsEnd"] <= now:
+            results[index] = PermissionError("Custom listing is closed")
+            continue
+        elif bid is not None:
+            results[index] = ValueError("Bid already exists")
+            continue
+        else:
+            bid = CustomListingBid(listingTrackingId=tracking_id,
+                                   listingLot=lot,
+                                   bidderInn=bidder_inn,
+                                   bidPrice=price,
+                                   ts=now)
+            bids[(tracking_id, lot)] = \
+                bid.dict(exclude={"id", "revision_id"})
+            requests.append(InsertOne(bids[(tracking_id, lot)]))
+        request_indices.append(index)
+    if not requests:
+        return results
+
+    try:
+        await CustomListingBid.get_motor_collection().bulk_write(
+            requests, ordered=False)
+    except BulkWriteError as error:
+        for write_error in error.details["writeErrors"]:
+            if write_error["code"] != 11000:
+                raise
+            # A concurrent request placed the same bid
+            results[request_indices[write_error["index"]]] = \
+                ValueError("Bid already exists")
+
+    applied = [index for index in request_indices if results[index] is None]
+    placed = [index for index in applied if operations[index][2] is not None]
+    collection = CustomListing.get_motor_collection()
+    # Gate the new bids in the write: the listing may close meanwhile
+    gates = await asyncio.gather(*(
+        collection.find_one_and_update(
+            _open_listing_filter(*keys[index], now),
+            _bid_summary_update(
+                CustomListingBid.parse_obj(bids[keys[index]])),
+            projection=_BID_SUMMARY_FIELDS,
+            return_document=ReturnDocument.AFTER)
+        for index in placed))
+    summaries = {keys[index]: summary
+                 for index, summary in zip(placed, gates)
+                 if summary is not None}
+    # Bids withdrawn by a concurrent request since they were written
+    remaining = {bid["_id"] for bid in await (
+        CustomListingBid.get_motor_collection()
+        .find({"_id": {"$in": [bids[keys[index]]["_id"]
+                               for index in placed]}}, {"_id": 1})
+        .to_list(None))} if placed else set()
+    rejected = [index for index in placed if keys[index] not in summaries]
+    if rejected:
+        await CustomListingBid.get_motor_collection().delete_many(
+            {"_id": {"$in": [bids[keys[index]]["_id"]
+                             for index in rejected]}})
+        for index in rejected:
+            results[index] = PermissionError("Custom listing is closed") \
+                if keys[index] in listings \
+                else KeyError("Custom listing does not exist")
+
+    # Withdrawals and listings predating the summary are resynced, and so
+    # are the summaries a concurrent withdrawal ran on without its bid
+    resynced = [{"trackingId": keys[index][0], "lot": keys[index][1]}
+                for index in applied if operations[index][2] is None
+                or bids[keys[index]]["_id"] not in remaining
+                or "bidCount" not in summaries.get(keys[index],
+                                                   {"bidCount": 0})]
+    applied = [index for index in applied if results[index] is None]
+    if not applied and not resynced:
+        return results
+    if resynced:
+        await (collection
+               .aggregate(_bid_state_pipeline({"$or": resynced}))
+               .to_list(None))
+        summaries.update({
+            (summary.pop("trackingId"), summary.pop("lot")): summary
+            for summary in await collection.find(
+                {"$or": resynced},
+                {**_BID_SUMMARY_FIELDS, "trackingId": 1, "lot": 1}
+            ).to_list(None)})
+    await publish_listing_events(
+        (tracking_id, lot,
+         {"type": "bid_withdrawn" if price is None else "bid_placed",
+          "bid": _bid_delta(
+              CustomListingBid.parse_obj(bids[(tracking_id, lot)])),
+          "listing": summaries.get((tracking_id, lot))})
+        for tracking_id, lot, price in map(operations.__getitem__, applied))
+    placed = [index for index in placed if results[index] is None]
+    if placed:
+        await rollup.record_event("bids", now, len(placed))
+        await activity.record_role(user_email, "supplier")
+    return results
 
 
 async def get_lowest_bid(listing_tracking_id: int,
                          listing_lot: int) -> float | None:
-    """Get the lowest bid on a Custom Listing."""
-    bids = await get_bid_list(listing_tracking_id,
-                              listing_lot)
-    if len(bids) == 0:
-        listing = await get_custom_listing(listing_tracking_id,
-                                           listing_lot,
-                                           set_bid_dynamics=False)
-        return listing.basePrice if listing else None
-    return bids[0].bidPrice
-
-
-async def get_bid_dynamic(listing_tracking_id: int,
-                          listing_lot: int) -> int:
-    """Get listing dynamic (decreasing, increasing, stale)."""
-    base = await get_custom_listing(listing_tracking_id, listing_lot,
-                                    set_bid_dynamics=False)
-    if base is None:
-        raise ValueError
-    base = base.basePrice
-    current = await get_latest_bid(listing_tracking_id, listing_lot)
-    if current is None:
-        return 0
-    if base == current:
-        return 0
-    if base > current:
-        return -1
-    return 1
-
-
-async def set_bid_dynamic(listing_tracking_id: int,
-                          listing_lot: int,
-                          dynamic: int):
-    """Set bid dynamic for Custom Listing."""
-    await (CustomListing.find_one(CustomListing.trackingId
-                                  == listing_tracking_id,
-                                  CustomListing.lot == listing_lot)
-           .set({CustomListing.dynamic: dynamic}))  # type: ignore
-
+    """Get the lowest bid on a Custom Listing.
 
-async def set_all_bid_dynamics():
-    """Set bid dynamics for all Custom Listings."""
-    listings = await get_all_custom_listings(set_bid_dynamics=False)
-    for listing in listings:
-        await set_bid_dynamic(listing.trackingId, listing.lot,
-                              await get_bid_dynamic(listing.trackingId,
-                                                    listing.lot))
+    If none exist, get the basePrice.
+    """
+    listing = await get_custom_listing(listing_tracking_id, listing_lot)
+    if listing is None:
+        return None
+    if listing.lowestBid is None:
+        return listing.basePrice
+    return listing.lowestBid
+
+
+# Sign of (latest bid - base price), 0 if there are no bids
+_DYNAMIC_EXPRESSION = {"$cond": [{"$eq": [{"$ifNull": ["$latestBid", None]},
+                                          None]},
+                                 0,
+                                 {"$cmp": ["$latestBid", "$basePrice"]}]}
+
+
+def _bid_state_pipeline(match: dict) -> list:
+    """Build an aggregation merging bid summaries into the listings."""
+    return [
+        {"$match": match},
+        {"$lookup": {
+            "from": CustomListingBid.get_motor_collection().name,
+            "let": {"trackingId": "$trackingId", "lot": "$lot"},
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [
+                    {"$eq": ["$listingTrackingId", "$$trackingId"]},
+                    {"$eq": ["$listingLot", "$$lot"]}]}}},
+                {"$sort": {"ts": -1}},
+                {"$group": {"_id": None,
+                            "count": {"$sum": 1},
+                            "lowest": {"$min": "$bidPrice"},
+                            "latest": {"$first": "$bidPrice"},
+                            "latestTs": {"$first": "$ts"}}}],
+            "as": "bids"}},
+        {"$set": {"bids": {"$first": "$bids"}}},
+        {"$project": {"basePrice": 1,
+                      "bidCount": {"$ifNull": ["$bids.count", 0]},
+                      "lowestBid": {"$ifNull": ["$bids.lowest", None]},
+                      "latestBid": {"$ifNull": ["$bids.latest", None]},
+                      "latestBidTs": {"$ifNull": ["$bids.latestTs", None]}}},
+        {"$set": {"dynamic": _DYNAMIC_EXPRESSION}},
+        {"$unset": "basePrice"},
+        {"$merge": {"into": CustomListing.get_motor_collection().name,
+                    "on": "_id",
+                    "whenMatched": "merge",
+                    "whenNotMatched": "discard"}},
+    ]
+
+
+async def sync_bid_state(listing_tracking_id: int,
+                         listing_lot: int):
+    """Recompute the bid summary of a Custom Listing server-side."""
+    await (CustomListing.get_motor_collection()
+           .aggregate(_bid_state_pipeline(
+               {"trackingId": listing_tracking_id,
+                "lot": listing_lot}))
+           .to_list(None))
+
+
+async def repair_bid_state(batch_size: int = 500,
+                           missing_only: bool = False) -> int:
+    """Recompute bid summaries of all Custom Listings in batches.
+
+    With `missing_only`, only of the listings created before the summary
+    existed. Return the number of processed listings.
+    """
+    collection = CustomListing.get_motor_collection()
+    processed = 0
+    last_id = None
+    while True:
+        query = {"bidCount": {"$exists": False}} if missing_only else {}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await (collection.find(query, {"_id": 1})
+                       .sort("_id", 1)
+                       .limit(batch_size)
+                       .to_list(None))
+        if not batch:
+            return processed
+        ids = [document["_id"] for document in batch]
+        await (collection
+               .aggregate(_bid_state_pipeline({"_id": {"$in": ids}}))
+               .to_list(None))
+        processed += len(ids)
+        last_id = ids[-1]
 
 
 async def get_latest_bid(listing_tracking_id: int,
                          listing_lot: int) -> float | None:
     """Get the latest bid on a Custom Listing."""
-    bid = (await CustomListingBid
-           .find_one(CustomListingBid.listingTrackingId
-                     == listing_tracking_id,
-                     CustomListingBid.listingLot == listing_lot))
-    if bid is None:
+    listing = await get_custom_listing(listing_tracking_id, listing_lot)
+    if listing is None:
         return None
-    return bid.bidPrice
+    return listing.latestBid
 
 
 async def get_bid_list(listing_tracking_id: int,
-                       listing_lot: int) -> List[CustomListingBid]:
-    """Get all bids for a listing."""
+                       listing_lot: int,
+                       limit: int | None = None,
+                       cursor: str | None = None
+                       ) -> Tuple[List[CustomListingBid], str | None]:
+    """Get a page of bids for a listing, ordered by price.
+
+    Return the bids and the cursor of the next page (None on the last page).
+    """
+    limit = _page_size(limit)
+    query: list = [CustomListingBid.listingTrackingId == listing_tracking_id,
+                   CustomListingBid.listingLot == listing_lot]
+    if cursor is not None:
+        key = _decode_cursor(cursor)
+        if not isinstance(key.get("price"), (int, float)):
+            raise ValueError("Malformed cursor")
+        query.append({"$or": [{"bidPrice": {"$gt": key["price"]}},
+                              {"bidPrice": key["price"],
+                               "_id": {"$gt": key["id"]}}]})
     bids = await (CustomListingBid
-                  .find(CustomListingBid.listingTrackingId
-                        == listing_tracking_id,
-                        CustomListingBid.listingLot == listing_lot)
+                  .find(*query)
                   .sort((CustomListingBid.bidPrice,
-                         SortDirection.ASCENDING))  # type: ignore
+                         SortDirection.ASCENDING),  # type: ignore
+                        ("_id", SortDirection.ASCENDING))
+                  .limit(limit + 1)
                   .to_list(None))
-    return bids
+    if len(bids) <= limit:
+        return bids, None
+    bids = bids[:limit]
+    return bids, _encode_cursor({"id": str(bids[-1].id),
+                                 "price": bids[-1].bidPrice})
 
 
 async def declare_custom_listing_winner(user_email: str,
@@ -398,6 +1155,56 @@ async def declare_custom_listing_winner(user_email: str,
         CustomListing.lot == listing_lot)
         .set({CustomListing.winnerInn: winner_inn,
               CustomListing.isActive: False}))  # type: ignore
+    await publish_listing_event(listing_tracking_id, listing_lot,
+                                {"type": "winner_declared",
+                                 "listing": {"winnerInn": winner_inn,
+                                             "isActive": False}})
+
+
+async def close_expired_custom_listings(batch_size: int = 500) -> int:
+    """Deactivate the Custom Listings whose tsEnd has passed.
+
+    Close them in batches and publish a listing_closed event for each.
+    Return the number of closed listings. tsEnd is stored in UTC.
+    """
+    collection = CustomListing.get_motor_collection()
+    now = datetime.utcnow()
+    query = {"isActive": True, "tsEnd": {"$lte": now}}
+    closed = 0
+    while True:
+        batch = await (collection.find(query, {"_id": 1})
+                       .sort("tsEnd", 1)
+                       .limit(batch_size)
+                       .to_list(None))
+        if not batch:
+            return closed
+        ids = [listing["_id"] for listing in batch]
+        # Re-check the deadline: the owner may have extended it meanwhile
+        result = await collection.update_many(
+            {**query, "_id": {"$in": ids}},
+            {"$set": {"isActive": False, "closedAt": now}})
+        if not result.modified_count:
+            continue
+        # Only announce the listings this update closed, not those whose
+        # winner was declared meanwhile
+        batch = await collection.find(
+            {"_id": {"$in": ids}, "closedAt": now},
+            {"_id": 0, "trackingId": 1, "lot": 1}).to_list(None)
+        await publish_listing_events(
+            (listing["trackingId"], listing["lot"],
+             {"type": "listing_closed", "listing": {"isActive": False}})
+            for listing in batch)
+        closed += result.modified_count
+
+
+async def get_custom_listing_deadlines(until: datetime) -> List[datetime]:
+    """Get the sorted tsEnd of active Custom Listings closing until then."""
+    listings = await (CustomListing.get_motor_collection()
+                      .find({"isActive": True, "tsEnd": {"$lte": until}},
+                            {"_id": 0, "tsEnd": 1})
+                      .sort("tsEnd", 1)
+                      .to_list(None))
+    return [listing["tsEnd"] for listing in listings]
 
 
 async def get_won_custom_listings(user_email: str) -> list:
@@ -405,6 +1212,64 @@ async def get_won_custom_listings(user_email: str) -> list:
     company_inn = (await get_user_company(user_email))["inn"]
     return await CustomListing.find(
         CustomListing.winnerInn == company_inn).to_list(None)
+
+
+def _custom_listing_filter(active: bool | None,
+                           company_inn: int | None,
+                           kind: str | None) -> dict:
+    """Build a Custom Listing query from the optional export filters."""
+    query: dict = {}
+    if active is not None:
+        query["isActive"] = active
+    if company_inn is not None:
+        query["companyInn"] = company_inn
+    if kind is not None:
+        query["kind"] = kind
+    return query
+
+
+async def iter_custom_listings(active: bool | None = None,
+                               company_inn: int | None = None,
+                               kind: str | None = None
+                               ) -> AsyncIterator[dict]:
+    """Iterate over raw Custom Listing documents in batches."""
+    cursor = (CustomListing.get_motor_collection()
+              .find(_custom_listing_filter(active, company_inn, kind),
+                    {"searchTerms": 0})
+              .sort("_id", 1)
+              .batch_size(EXPORT_BATCH_SIZE))
+    async for document in cursor:
+        yield document
+
+
+async def iter_custom_listing_bids(active: bool | None = None,
+                                   company_inn: int | None = None,
+                                   kind: str | None = None
+                                   ) -> AsyncIterator[dict]:
+    """Iterate over raw bid documents of the matching Custom Listings."""
+    query = _custom_listing_filter(active, company_inn, kind)
+    if not query:
+        cursor = (CustomListingBid.get_motor_collection()
+                  .find()
+                  .sort("_id", 1)
+                  .batch_size(EXPORT_BATCH_SIZE))
+    else:
+        cursor = CustomListing.get_motor_collection().aggregate([
+            {"$match": query},
+            {"$project": {"trackingId": 1, "lot": 1}},
+            {"$lookup": {
+                "from": CustomListingBid.get_motor_collection().name,
+                "localField": "trackingId",
+                "foreignField": "listingTrackingId",
+                "let": {"lot": "$lot"},
+                "pipeline": [{"$match": {"$expr": {
+                    "$eq": ["$listingLot", "$$lot"]}}}],
+                "as": "bids"}},
+            {"$unwind": "$bids"},
+            {"$replaceRoot": {"newRoot": "$bids"}},
+        ], batchSize=EXPORT_BATCH_SIZE)
+    async for document in cursor:
+        yield document
 # endregion
 
 
@@ -413,6 +1278,7 @@ async def elevate_privileges(user_email: str):
     """Elevate user's privileges to administrative."""
     (await User.find_one(User.email == user_email)
      .set({User.isAdmin: True}))  # type: ignore
+    user_cache.invalidate(user_email)
 
 
 async def is_admin(user_email: str) -> bool:
@@ -423,33 +1289,67 @@ async def is_admin(user_email: str) -> bool:
 
 
 # region Statistics
-async def get_daily_statistics() -> dict | None:
-    """Get daily statistics in JSON-like format."""
-    stats = await StatisticsProto.find_one()
-    if stats is None:
+async def get_statistics_series(granularity: str,
+                                pid: int) -> List[dict] | None:
+    """Get one statistics series in JSON-like format."""
+    series = await (connection.read_collection(StatisticsSeries)
+                    .find_one({"granularity": granularity, "pid": pid},
+                              {"points": 1}))
+    if series is None:
         return None
-    return stats.daily  # type: ignore # type.ignore
+    return series["points"]
 
 
-async def get_monthly_statistics() -> dict | None:
-    """Get monthly statistics in JSON-like format."""
-    stats = await StatisticsProto.find_one()
-    if stats is None:
-        return None
-    return stats.monthly  # type: ignore # type.ignore
+async def write_statistics(statistics: dict):
+    """Upsert statistics series in one bulk write.
+
+    Pass the series lists by granularity, e.g. {"daily": [[...], ...]}.
+    """
+    updates = [UpdateOne({"granularity": granularity, "pid": pid},
+                         {"$set": {"points": points}},
+                         upsert=True)
+               for granularity, series in statistics.items()
+               for pid, points in enumerate(series or [])]
+    if updates:
+        await (StatisticsSeries.get_motor_collection()
+               .bulk_write(updates, ordered=False))
+    stats_response_cache.clear()
 
 
-async def get_yearly_statistics() -> dict | None:
-    """Get yearly statistics in JSON-like format."""
-    stats = await StatisticsProto.find_one()
-    if stats is None:
-        return None
-    return stats.yearly  # type: ignore # type.ignore
+async def migrate_statistics_proto() -> int:
+    """Split the legacy StatisticsProto document into StatisticsSeries.
+
+    Return the number of migrated series.
+    """
+    proto = await StatisticsProto.find_one()
+    if proto is None:
+        return 0
+    statistics = {granularity: getattr(proto, granularity)
+                  for granularity in STATISTICS_GRANULARITIES}
+    await write_statistics(statistics)
+    await StatisticsProto.find_all().delete()
+    return sum(len(series or []) for series in statistics.values())
 # endregion
 
 
 # region Achievements
 async def get_all_scripts() -> List[Script]:
     """Get all Scripts."""
-    return await Script.find().to_list(None)
+    scripts = catalogue_cache.get("scripts")
+    if scripts is None:
+        scripts = await Script.find().to_list(None)
+        # Do not pin an empty catalogue while another worker seeds it
+        if scripts:
+            catalogue_cache.set("scripts", scripts)
+    return list(scripts)
+
+
+async def get_all_tasks() -> List[Task]:
+    """Get all Tasks."""
+    tasks = catalogue_cache.get("tasks")
+    if tasks is None:
+        tasks = await Task.find().to_list(None)
+        if tasks:
+            catalogue_cache.set("tasks", tasks)
+    return list(tasks)
 # endregion
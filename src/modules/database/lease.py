@@ -0,0 +1,37 @@
+"""Fleet-wide leases, so that one worker runs a job at a time."""
+from datetime import datetime, timedelta
+from os import getpid
+from socket import gethostname
+
+from pymongo.errors import DuplicateKeyError
+
+from .models import Lease
+
+# Owner of the leases taken by this process
+WORKER_ID = f"{gethostname()}:{getpid()}"
+
+
+async def acquire(name: str, ttl: float) -> bool:
+    """Take or renew a lease for `ttl` seconds.
+
+    Return False if another live worker holds it. A lease of a crashed
+    worker is taken over once it expires.
+    """
+    now = datetime.utcnow()
+    try:
+        await Lease.get_motor_collection().update_one(
+            {"name": name,
+             "$or": [{"owner": WORKER_ID}, {"expiresAt": {"$lte": now}}]},
+            {"$set": {"owner": WORKER_ID,
+                      "expiresAt": now + timedelta(seconds=ttl)}},
+            upsert=True)
+    except DuplicateKeyError:
+        # The lease exists and is held by someone else
+        return False
+    return True
+
+
+async def release(name: str):
+    """Release a lease if this worker holds it."""
+    await Lease.get_motor_collection().delete_one({"name": name,
+                                                   "owner": WORKER_ID})
@@ -2,6 +2,7 @@
 from beanie import Document, PydanticObjectId
 from typing import List
 from pydantic import BaseModel, Field
+from pymongo import IndexModel, ASCENDING, DESCENDING
 from datetime import datetime
 
 
@@ -41,6 +42,15 @@ class User(Document):
     city: str | None = None
     companyName: str | None = None
     companyInn: int | None = None
+    activityIndex: int | None = None  # Bit of the user in activity bitmaps
+
+    class Settings:
+        """Collection settings."""
+
+        indexes = [
+            IndexModel([("email", ASCENDING)], unique=True),
+            IndexModel([("companyInn", ASCENDING)]),
+        ]
 
 
 class UserAchievements(Document):
@@ -50,6 +60,13 @@ class UserAchievements(Document):
     achievement: Achievement
     ts: datetime = Field(default_factory=datetime.now)  # type: ignore
 
+    class Settings:
+        """Collection settings."""
+
+        indexes = [
+            IndexModel([("userId", ASCENDING)]),
+        ]
+
 
 class CustomListing(Document):
     """Custom listings model for Beanie."""
@@ -66,6 +83,34 @@ class CustomListing(Document):
     dynamic: int
     tsBegin: datetime = Field(default_factory=datetime.now)
     winnerInn: int | None = None
+    # Bid summary, kept up to date by the bid write path
+    bidCount: int = 0
+    lowestBid: float | None = None
+    latestBid: float | None = None
+    latestBidTs: datetime | None = None
+    # Stems of the name and description words, see search.search_terms
+    searchTerms: List[str] = []
+
+    class Settings:
+        """Collection settings."""
+
+        indexes = [
+            IndexModel([("trackingId", ASCENDING), ("lot", ASCENDING)],
+                       unique=True),
+            # Keyset pagination sorts every listing query by _id
+            IndexModel([("companyInn", ASCENDING), ("_id", ASCENDING)]),
+            IndexModel([("companyInn", ASCENDING),
+                        ("isActive", ASCENDING),
+                        ("_id", ASCENDING)]),
+            IndexModel([("isActive", ASCENDING), ("_id", ASCENDING)]),
+            # Auction closing looks up active listings by deadline
+            IndexModel([("isActive", ASCENDING), ("tsEnd", ASCENDING)]),
+            IndexModel([("winnerInn", ASCENDING)]),
+            IndexModel([("searchTerms", ASCENDING)]),
+        ]
+
+
+UNIQUE_BID_INDEX = "listingTrackingId_1_listingLot_1_bidderInn_1"
 
 
 class CustomListingBid(Document):
@@ -77,15 +122,117 @@ class CustomListingBid(Document):
     bidPrice: float
     ts: datetime = Field(default_factory=datetime.now)
 
+    class Settings:
+        """Collection settings."""
+
+        indexes = [
+            IndexModel([("listingTrackingId", ASCENDING),
+                        ("listingLot", ASCENDING),
+                        ("bidPrice", ASCENDING),
+                        ("_id", ASCENDING)]),
+            IndexModel([("listingTrackingId", ASCENDING),
+                        ("listingLot", ASCENDING),
+                        ("ts", DESCENDING)]),
+            # A company bids at most once on a listing
+            IndexModel([("listingTrackingId", ASCENDING),
+                        ("listingLot", ASCENDING),
+                        ("bidderInn", ASCENDING)],
+                       name=UNIQUE_BID_INDEX,
+                       unique=True),
+        ]
+
 
 class StatisticsProto(Document):
-    """Statistics prototype model for Beanie."""
+    """Statistics prototype model for Beanie.
+
+    Legacy single-document layout, superseded by StatisticsSeries.
+    """
 
     daily: List[List[dict]] | None
     monthly: List[List[dict]] | None
     yearly: List[List[dict]] | None
 
 
+class StatisticsSeries(Document):
+    """Statistics series model for Beanie."""
+
+    granularity: str  # "daily" / "monthly" / "yearly"
+    pid: int
+    points: List[dict]  # [{"x": "Jan", "y": 94}, ...]
+
+    class Settings:
+        """Collection settings."""
+
+        indexes = [
+            IndexModel([("granularity", ASCENDING), ("pid", ASCENDING)],
+                       unique=True),
+        ]
+
+
+class StatisticsCounter(Document):
+    """Statistics rollup counter model for Beanie."""
+
+    metric: str  # "bids" / "listings" / "signups"
+    granularity: str  # "daily" / "monthly" / "yearly"
+    bucket: datetime  # Start of the day / month / year
+    value: int
+
+    class Settings:
+        """Collection settings."""
+
+        indexes = [
+            IndexModel([("metric", ASCENDING),
+                        ("granularity", ASCENDING),
+                        ("bucket", ASCENDING)],
+                       unique=True),
+        ]
+
+
+class ActivityBitmap(Document):
+    """Activity bitmap chunk model for Beanie."""
+
+    key: str  # Day ("2023-06-01") or role ("role:supplier")
+    chunk: int
+    words: List[int]  # 64-bit words, bit i is the user i of the chunk
+
+    class Settings:
+        """Collection settings."""
+
+        indexes = [
+            IndexModel([("key", ASCENDING), ("chunk", ASCENDING)],
+                       unique=True),
+        ]
+
+
+class Sequence(Document):
+    """Named sequence model for Beanie."""
+
+    name: str
+    value: int
+
+    class Settings:
+        """Collection settings."""
+
+        indexes = [
+            IndexModel([("name", ASCENDING)], unique=True),
+        ]
+
+
+class Lease(Document):
+    """Fleet-wide lease on a named job for Beanie."""
+
+    name: str
+    owner: str  # "<hostname>:<pid>" of the holding worker
+    expiresAt: datetime
+
+    class Settings:
+        """Collection settings."""
+
+        indexes = [
+            IndexModel([("name", ASCENDING)], unique=True),
+        ]
+
+
 # region Events
 class Metric(Document):
     """Metric model for Beanie."""
@@ -93,6 +240,13 @@ class Metric(Document):
     name: str
     history: dict  # {'supplier': [...], 'customer': [...], 'all': [...]}
 
+    class Settings:
+        """Collection settings."""
+
+        indexes = [
+            IndexModel([("name", ASCENDING)], unique=True),
+        ]
+
 
 class TaskGoal(Document):
     """Task goal model for Beanie."""
@@ -100,6 +254,13 @@ class TaskGoal(Document):
     name: str
     target: dict  # {"kind": "full-profile", "count": 1}
 
+    class Settings:
+        """Collection settings."""
+
+        indexes = [
+            IndexModel([("name", ASCENDING)], unique=True),
+        ]
+
 
 class Task(Document):
     """Task model for Beanie."""
@@ -110,6 +271,13 @@ class Task(Document):
     taskGoals: List[str]  # TaskGoal names
     metrics: List[str]  # ["CRR", "CR", "ROI/ROMI"]
 
+    class Settings:
+        """Collection settings."""
+
+        indexes = [
+            IndexModel([("name", ASCENDING)], unique=True),
+        ]
+
 
 class Script(Document):
     """Script model for Beanie."""
@@ -119,4 +287,13 @@ class Script(Document):
     tasks: List[str]  # Task names
     metrics: list  # Metric, Weight
     kind: str  # "all" / ...
+
+    class Settings:
+        """Collection settings."""
+
+        # Script names are not unique in the fixtures
+        indexes = [
+            IndexModel([("name", ASCENDING)]),
+            IndexModel([("kind", ASCENDING)]),
+        ]
 # endregion
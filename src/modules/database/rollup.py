@@ -0,0 +1,133 @@
+"""Incremental statistics rollups of bids, listings and signups."""
+from collections import Counter
+from datetime import datetime
+from typing import List, Dict, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+
+from modules.cache import stats_response_cache
+from . import connection
+from .models import User, CustomListing, CustomListingBid, \
+    StatisticsCounter
+
+# Bucket unit (NumPy datetime64) and number of buckets served per series
+GRANULARITIES = {"daily": ("D", 7),
+                 "monthly": ("M", 12),
+                 "yearly": ("Y", 5)}
+# Point labels of the served series
+LABEL_FORMATS = {"daily": "%Y-%m-%d",
+                 "monthly": "%b",
+                 "yearly": "%Y"}
+# Rolled up metrics: source collection and its event timestamp field
+METRICS = {"bids": (CustomListingBid, "ts"),
+           "listings": (CustomListing, "tsBegin"),
+           "signups": (User, "_id")}  # ObjectId creation time
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    """Get the start of the bucket the timestamp falls into."""
+    unit = GRANULARITIES[granularity][0]
+    return np.datetime64(ts, unit).astype("datetime64[ms]").tolist()
+
+
+def bucket_counts(timestamps: np.ndarray
+                  ) -> Dict[Tuple[str, datetime], int]:
+    """Count timestamps (datetime64[ms]) per bucket of every granularity."""
+    counts: Dict[Tuple[str, datetime], int] = {}
+    for granularity, (unit, _) in GRANULARITIES.items():
+        buckets, sizes = np.unique(timestamps.astype(f"datetime64[{unit}]"),
+                                   return_counts=True)
+        for bucket, size in zip(buckets.astype("datetime64[ms]").tolist(),
+                                sizes.tolist()):
+            counts[(granularity, bucket)] = size
+    return counts
+
+
+def invalidate_responses(metric: str):
+    """Drop the cached statistics responses of a metric in this worker.
+
+    The other workers expire theirs after STATS_LIVE_CACHE_TTL.
+    """
+    for granularity in GRANULARITIES:
+        stats_response_cache.invalidate((granularity, metric))
+
+
+async def record_event(metric: str, ts: datetime | None = None,
+                       count: int = 1):
+    """Count events in the buckets of every granularity."""
+    ts = datetime.now() if ts is None else ts
+    await StatisticsCounter.get_motor_collection().bulk_write([
+        UpdateOne({"metric": metric,
+                   "granularity": granularity,
+                   "bucket": bucket_start(ts, granularity)},
+                  {"$inc": {"value": count}},
+                  upsert=True)
+        for granularity in GRANULARITIES], ordered=False)
+    invalidate_responses(metric)
+
+
+async def backfill(batch_size: int = 10000) -> Dict[str, int]:
+    """Recompute all counters from the source collections.
+
+    Timestamps are streamed in batches and bucketed with NumPy. Events
+    recorded while the backfill runs may be overwritten, run it when the
+    traffic is low. Return the number of events per metric.
+    """
+    events: Dict[str, int] = {}
+    for metric, (model, field) in METRICS.items():
+        counts: Counter = Counter()
+        cursor = (model.get_motor_collection()
+                  .find({}, {field: 1})
+                  .batch_size(batch_size))
+        batch: List[datetime] = []
+        events[metric] = 0
+        async for document in cursor:
+            ts = document[field]
+            if field == "_id":
+                # Event timestamps are naive local times, like now()
+                ts = ts.generation_time.astimezone().replace(tzinfo=None)
+            batch.append(ts)
+            if len(batch) == batch_size:
+                counts.update(bucket_counts(np.array(batch,
+                                                     "datetime64[ms]")))
+                events[metric] += len(batch)
+                batch = []
+        if batch:
+            counts.update(bucket_counts(np.array(batch, "datetime64[ms]")))
+            events[metric] += len(batch)
+        collection = StatisticsCounter.get_motor_collection()
+        await collection.delete_many({"metric": metric})
+        if counts:
+            await collection.insert_many(
+                [{"metric": metric,
+                  "granularity": granularity,
+                  "bucket": bucket,
+                  "value": value}
+                 for (granularity, bucket), value in counts.items()],
+                ordered=False)
+        invalidate_responses(metric)
+    return events
+
+
+async def get_series(metric: str, granularity: str) -> List[dict] | None:
+    """Get the latest buckets of a metric as an {x, y} series.
+
+    Return None if the metric or the granularity is unknown.
+    """
+    if metric not in METRICS or granularity not in GRANULARITIES:
+        return None
+    unit, length = GRANULARITIES[granularity]
+    last = np.datetime64(datetime.now(), unit)
+    buckets = (np.arange(last - length + 1, last + 1)
+               .astype("datetime64[ms]").tolist())
+    counters = await (connection.read_collection(StatisticsCounter)
+                      .find({"metric": metric,
+                             "granularity": granularity,
+                             "bucket": {"$gte": buckets[0]}},
+                            {"_id": 0, "bucket": 1, "value": 1})
+                      .to_list(None))
+    values = {counter["bucket"]: counter["value"] for counter in counters}
+    label = LABEL_FORMATS[granularity]
+    return [{"x": bucket.strftime(label), "y": values.get(bucket, 0)}
+            for bucket in buckets]
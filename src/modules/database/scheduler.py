@@ -0,0 +1,103 @@
+"""Background closing of Custom Listings once their tsEnd passes."""
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta, timezone
+from os import getenv
+from typing import List
+
+from pymongo.errors import PyMongoError
+
+from . import lease
+from .db import close_expired_custom_listings, \
+    get_custom_listing_deadlines
+
+logger = logging.getLogger(__name__)
+
+# Seconds between reloads of the upcoming deadlines (and lease renewals)
+AUCTION_REFRESH_INTERVAL = float(getenv("AUCTION_REFRESH_INTERVAL", "60"))
+# Listings deactivated per update
+AUCTION_CLOSE_BATCH_SIZE = int(getenv("AUCTION_CLOSE_BATCH_SIZE", "500"))
+CLOSER_LEASE = "auction-closer"
+
+
+class AuctionCloser:
+    """Close auctions at their deadlines, kept in a min-heap.
+
+    The heap only decides when to wake up: every wake-up closes all the
+    expired listings with one indexed query, so deadlines that moved or
+    were missed while no worker ran are handled as well. One worker of
+    the fleet (the holder of the lease) closes auctions at a time.
+    """
+
+    def __init__(self, refresh_interval: float, batch_size: int):
+        """Reload deadlines every `refresh_interval` seconds."""
+        self.refresh_interval = refresh_interval
+        self.batch_size = batch_size
+        self.is_leader = False
+        self._deadlines: List[datetime] = []
+        self._refresh_at = datetime.min
+        self._wakeup = asyncio.Event()
+
+    def schedule(self, ts_end: datetime):
+        """Add the deadline of a new or extended listing."""
+        if not self.is_leader:
+            # The leader picks it up on its next reload
+            return
+        if ts_end.tzinfo is not None:
+            # Like MongoDB, compare deadlines in naive UTC
+            ts_end = ts_end.astimezone(timezone.utc).replace(tzinfo=None)
+        heapq.heappush(self._deadlines, ts_end)
+        if self._deadlines[0] == ts_end:
+            self._wakeup.set()
+
+    async def tick(self) -> int:
+        """Close the expired auctions, return how many were closed."""
+        now = datetime.utcnow()
+        closed = await close_expired_custom_listings(self.batch_size)
+        if now >= self._refresh_at:
+            # Pick up listings created by the other workers
+            self._refresh_at = now + timedelta(seconds=self.refresh_interval)
+            self._deadlines = await get_custom_listing_deadlines(
+                self._refresh_at)
+        while self._deadlines and self._deadlines[0] <= now:
+            heapq.heappop(self._deadlines)
+        return closed
+
+    def _timeout(self) -> float:
+        """Get the seconds until the next deadline or reload."""
+        if not self.is_leader:
+            return self.refresh_interval
+        wakeup_at = self._refresh_at
+        if self._deadlines:
+            wakeup_at = min(wakeup_at, self._deadlines[0])
+        return max((wakeup_at - datetime.utcnow()).total_seconds(), 0)
+
+    async def run(self):
+        """Close auctions while this worker holds the lease."""
+        while True:
+            try:
+                self.is_leader = await lease.acquire(
+                    CLOSER_LEASE, self.refresh_interval * 3)
+                if self.is_leader:
+                    closed = await self.tick()
+                    if closed:
+                        logger.info("Closed %d expired auctions", closed)
+            except PyMongoError:
+                self.is_leader = False
+                logger.exception("Could not close expired auctions")
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._timeout())
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self):
+        """Hand the lease over to another worker."""
+        if self.is_leader:
+            await lease.release(CLOSER_LEASE)
+            self.is_leader = False
+
+
+auction_closer = AuctionCloser(AUCTION_REFRESH_INTERVAL,
+                               AUCTION_CLOSE_BATCH_SIZE)
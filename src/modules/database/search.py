@@ -0,0 +1,76 @@
+"""Stemmed search terms of Custom Listings."""
+import re
+from typing import List, Tuple
+
+from bson.regex import Regex
+from snowballstemmer import stemmer
+
+WORD = re.compile(r"\w+")
+CYRILLIC = re.compile(r"[а-я]")
+# Name terms are stored once more with this marker to rank name matches
+NAME_MARKER = "n:"
+# Shorter partial words are matched as whole words (prefix scans are wide)
+MIN_PREFIX_LENGTH = 2
+
+_russian = stemmer("russian")
+_english = stemmer("english")
+
+
+def words(text: str) -> List[str]:
+    """Split a text into lowercase words."""
+    return WORD.findall(text.lower().replace("ё", "е"))
+
+
+def stem(word: str) -> str:
+    """Reduce a lowercase word to its Russian or English stem."""
+    if CYRILLIC.search(word):
+        return _russian.stemWord(word)
+    return _english.stemWord(word)
+
+
+def search_terms(name: str, description: str | None) -> List[str]:
+    """Get the indexed terms of a Custom Listing."""
+    name_stems = {stem(word) for word in words(name)}
+    stems = name_stems | {stem(word) for word in words(description or "")}
+    return sorted(stems) + sorted(NAME_MARKER + term for term in name_stems)
+
+
+def parse_query(query: str) -> Tuple[List[str], str | None]:
+    """Split a query into the stems of whole words and a partial word.
+
+    The last word is partial (being typed) unless the query ends with a
+    space.
+    """
+    query_words = words(query)
+    partial = None
+    if query_words and not query[-1].isspace() \
+            and len(query_words[-1]) >= MIN_PREFIX_LENGTH:
+        partial = query_words.pop()
+    return [stem(word) for word in query_words], partial
+
+
+def term_filter(stems: List[str], partial: str | None) -> dict:
+    """Match listings having every stem and a term starting the partial."""
+    clauses: List[dict] = []
+    if stems:
+        clauses.append({"searchTerms": {"$all": stems}})
+    if partial is not None:
+        # The partial word may already be whole, in another inflection
+        clauses.append({"searchTerms": {"$in": [
+            stem(partial), Regex("^" + re.escape(partial))]}})
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def score_expression(stems: List[str], partial: str | None) -> dict:
+    """Score matched listings: name matches weigh more (3 against 1)."""
+    in_name = [{"$in": [NAME_MARKER + term, "$searchTerms"]}
+               for term in stems]
+    if partial is not None:
+        in_name.append({"$or": [
+            {"$in": [NAME_MARKER + stem(partial), "$searchTerms"]},
+            {"$anyElementTrue": [{"$map": {
+                "input": "$searchTerms",
+                "in": {"$regexMatch": {
+                    "input": "$$this",
+                    "regex": "^" + re.escape(NAME_MARKER + partial)}}}}]}]})
+    return {"$add": [{"$cond": [matched, 3, 1]} for matched in in_name]}
@@ -0,0 +1,68 @@
+"""Idempotent seeding of the fixture collections."""
+from json import load
+from pathlib import Path
+from typing import Type
+
+from beanie import Document
+from pymongo import UpdateOne
+
+from modules.cache import catalogue_cache
+from .db import write_statistics
+from .models import Metric, TaskGoal, Task, Script
+
+MOCK_DATA = Path(__file__).parent / "mock_data"
+ACHIEVEMENTS_FILE = MOCK_DATA / "mock_achievements.json"
+STATISTICS_FILE = MOCK_DATA / "mock_statistics.json"
+# Fixture section, model, upsert key fields and update operator
+FIXTURES = [
+    ("scripts", Script, ("name", "tasks"), "$set"),
+    ("tasks", Task, ("name",), "$set"),
+    ("task_goals", TaskGoal, ("name",), "$set"),
+    # Metric histories are computed live, never overwrite them
+    ("metrics", Metric, ("name",), "$setOnInsert"),
+]
+
+
+async def is_seeded() -> bool:
+    """Check whether the fixtures were already seeded."""
+    return await Script.get_motor_collection().find_one(
+        {}, {"_id": 1}) is not None
+
+
+async def upsert_fixtures(model: Type[Document], documents: list,
+                          key: tuple, operator: str):
+    """Validate and upsert fixture documents in one bulk write."""
+    updates = []
+    for document in documents:
+        fields = model.parse_obj(document).dict(exclude={"id",
+                                                         "revision_id"})
+        updates.append(UpdateOne({name: fields[name] for name in key},
+                                 {operator: fields},
+                                 upsert=True))
+    if updates:
+        await model.get_motor_collection().bulk_write(updates, ordered=False)
+
+
+async def seed_fixtures(achievements_f: Path = ACHIEVEMENTS_FILE,
+                        statistics_f: Path = STATISTICS_FILE,
+                        force: bool = False) -> bool:
+    """Fill the scripts, tasks, goals, metrics and statistics.
+
+    Do nothing (and do not parse the files) if the fixtures were seeded,
+    unless forced. Return whether the fixtures were written.
+    """
+    if not force and await is_seeded():
+        return False
+
+    with open(achievements_f, 'r') as f:
+        data = load(f)
+    for section, model, key, operator in FIXTURES:
+        await upsert_fixtures(model, data[section], key, operator)
+    catalogue_cache.clear()
+
+    with open(statistics_f, 'r') as f:
+        data_stat: dict = load(f)['statistics']
+    await write_statistics({"daily": data_stat['day'],
+                            "monthly": data_stat['month'],
+                            "yearly": data_stat['year']})
+    return True
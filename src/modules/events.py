@@ -0,0 +1,229 @@
+"""Fan-out of live Custom Listing events to their subscribers."""
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from os import getenv
+from typing import AsyncIterator, Iterable, Tuple
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from modules.cache import shared_caches, pending_invalidations, \
+    invalidations_pending
+from modules.database import connection
+
+logger = logging.getLogger(__name__)
+
+# "local" fans out within a worker, "mongo" across all workers
+EVENTS_BACKEND = getenv("EVENTS_BACKEND", "local")
+# Events buffered per subscriber before it is told to resync
+EVENTS_QUEUE_SIZE = int(getenv("EVENTS_QUEUE_SIZE", "100"))
+# Seconds between keepalives of idle event streams
+EVENTS_KEEPALIVE = float(getenv("EVENTS_KEEPALIVE", "15"))
+# Capped collection relaying the events of the "mongo" backend
+EVENTS_COLLECTION = "listing_events"
+EVENTS_COLLECTION_SIZE = int(getenv("EVENTS_COLLECTION_SIZE",
+                                    str(16 * 1024 * 1024)))
+# Sent instead of the events a slow subscriber could not keep up with
+RESYNC_EVENT = {"type": "resync"}
+
+
+def apply_invalidation(name: str, key):
+    """Apply an invalidation relayed from another worker."""
+    cache = shared_caches.get(name)
+    if cache is None:
+        return
+    if key is None:
+        cache.clear(relay=False)
+    else:
+        # BSON turns tuple keys into lists
+        cache.invalidate(tuple(key) if isinstance(key, list) else key,
+                         relay=False)
+
+
+class LocalBroker:
+    """In-process pub/sub: events reach the subscribers of this worker."""
+
+    def __init__(self, queue_size: int):
+        """Buffer at most `queue_size` events per subscriber."""
+        self.queue_size = queue_size
+        self._subscribers: defaultdict[tuple, set[asyncio.Queue]] = \
+            defaultdict(set)
+
+    async def start(self):
+        """Start relaying events.
+
+        Warn if other workers serve subscribers this one cannot reach.
+        """
+        if int(getenv("WEB_CONCURRENCY", "1")) > 1:
+            logger.warning("EVENTS_BACKEND=local only reaches the "
+                           "subscribers and caches of this worker, set "
+                           "EVENTS_BACKEND=mongo with several workers")
+
+    async def stop(self):
+        """Stop relaying events."""
+
+    @asynccontextmanager
+    async def subscribe(self, key: tuple
+                        ) -> AsyncIterator[asyncio.Queue]:
+        """Get a queue of the events published under a key."""
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._subscribers[key].add(queue)
+        try:
+            yield queue
+        finally:
+            self._subscribers[key].discard(queue)
+            if not self._subscribers[key]:
+                del self._subscribers[key]
+
+    def fan_out(self, key: tuple, event: dict):
+        """Deliver an event to the subscribers of a key in this worker."""
+        for queue in self._subscribers.get(key, ()):
+            if queue.full():
+                # Deltas were lost, the subscriber has to refetch
+                while not queue.empty():
+                    queue.get_nowait()
+                event_or_resync = RESYNC_EVENT
+            else:
+                event_or_resync = event
+            queue.put_nowait(event_or_resync)
+
+    async def publish(self, key: tuple, event: dict):
+        """Publish an event to the subscribers of a key."""
+        self.fan_out(key, event)
+
+    async def publish_many(self, events: Iterable[Tuple[tuple, dict]]):
+        """Publish (key, event) pairs to the subscribers of their keys."""
+        for key, event in events:
+            self.fan_out(key, event)
+
+    async def flush_invalidations(self):
+        """Relay the pending shared cache invalidations to other workers.
+
+        Without other workers to reach, they are dropped.
+        """
+        pending_invalidations.clear()
+        invalidations_pending.clear()
+
+    async def relay_invalidations(self):
+        """Relay the shared cache invalidations as they are queued."""
+        while True:
+            await invalidations_pending.wait()
+            try:
+                await self.flush_invalidations()
+            except PyMongoError:
+                logger.exception("Could not relay cache invalidations")
+                await asyncio.sleep(1)
+
+    def stats(self) -> dict:
+        """Get the number of subscribed keys and subscribers."""
+        return {"keys": len(self._subscribers),
+                "subscribers": sum(map(len, self._subscribers.values()))}
+
+
+class MongoBroker(LocalBroker):
+    """Pub/sub relayed through a capped collection to every worker."""
+
+    def __init__(self, queue_size: int, collection_size: int):
+        """Relay events through a capped collection of that many bytes."""
+        super().__init__(queue_size)
+        self.collection_size = collection_size
+        self._task: asyncio.Task | None = None
+
+    @property
+    def collection(self):
+        """Get the capped collection relaying the events."""
+        return connection.get_database()[EVENTS_COLLECTION]
+
+    async def create_collection(self):
+        """Create the capped collection unless it exists."""
+        try:
+            await connection.get_database().create_collection(
+                EVENTS_COLLECTION, capped=True, size=self.collection_size)
+        except CollectionInvalid:
+            pass
+
+    async def start(self):
+        """Create the capped collection and start tailing it."""
+        await self.create_collection()
+        # Tail from a marker, the events published before it are history
+        marker = await self.collection.insert_one({"key": None})
+        self._task = asyncio.create_task(self._tail(marker.inserted_id))
+
+    async def stop(self):
+        """Stop tailing the capped collection."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _tail(self, last_id):
+        """Fan out the events published by every worker.
+
+        ObjectIds of different workers are not ordered, so the events are
+        read in natural (insertion) order, resuming after the last one
+        seen.
+        """
+        while True:
+            try:
+                if await self.collection.find_one({"_id": last_id},
+                                                  {"_id": 1}) is None:
+                    # The capped collection wrapped past it: events lost
+                    for key in list(self._subscribers):
+                        self.fan_out(key, RESYNC_EVENT)
+                    marker = await self.collection.insert_one({"key": None})
+                    last_id = marker.inserted_id
+                resumed = False
+                async for document in self.collection.find(
+                        cursor_type=CursorType.TAILABLE_AWAIT):
+                    if not resumed:
+                        resumed = document["_id"] == last_id
+                        continue
+                    last_id = document["_id"]
+                    if document["key"] is not None:
+                        self.fan_out(tuple(document["key"]),
+                                     document["event"])
+                    elif "cache" in document:
+                        apply_invalidation(document["cache"],
+                                           document["entry"])
+            except PyMongoError:
+                logger.exception("Could not tail the listing events")
+            # The cursor dies when the collection is empty or on errors
+            await asyncio.sleep(1)
+
+    async def publish(self, key: tuple, event: dict):
+        """Publish an event to the subscribers of a key in any worker."""
+        await self.collection.insert_one({"key": list(key),
+                                          "event": event})
+
+    async def publish_many(self, events: Iterable[Tuple[tuple, dict]]):
+        """Publish (key, event) pairs in one write, in their order."""
+        documents = [{"key": list(key), "event": event}
+                     for key, event in events]
+        if documents:
+            await self.collection.insert_many(documents)
+
+    async def flush_invalidations(self):
+        """Relay the pending shared cache invalidations in one write."""
+        invalidations_pending.clear()
+        if not pending_invalidations:
+            return
+        invalidations = list(pending_invalidations)
+        pending_invalidations.clear()
+        # Processes that do not tail (manage.py) may write first
+        if self._task is None:
+            await self.create_collection()
+        try:
+            await self.collection.insert_many(
+                [{"key": None, "cache": name, "entry": key}
+                 for name, key in invalidations])
+        except PyMongoError:
+            for invalidation in invalidations:
+                pending_invalidations[invalidation] = None
+            invalidations_pending.set()
+            raise
+
+
+broker = MongoBroker(EVENTS_QUEUE_SIZE, EVENTS_COLLECTION_SIZE) \
+    if EVENTS_BACKEND == "mongo" else LocalBroker(EVENTS_QUEUE_SIZE)
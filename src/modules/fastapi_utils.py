@@ -1,5 +1,12 @@
 """FastAPI helper utils and classes."""
-from typing import Optional
+import gzip
+import re
+from hashlib import sha256
+from typing import Optional, Any
+import orjson
+from bson import ObjectId
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from datetime import datetime
 
@@ -48,6 +55,7 @@ class CustomListingModel(BaseModel):
     lot: int
     kind: str
     name: str
+    description: str | None = None  # Projected out of the list views
     companyInn: int
     basePrice: float
     isActive: bool
@@ -55,6 +63,10 @@ class CustomListingModel(BaseModel):
     tsEnd: datetime
     tsBegin: datetime
     winnerInn: int | None = None
+    bidCount: int = 0
+    lowestBid: float | None = None
+    latestBid: float | None = None
+    latestBidTs: datetime | None = None
 
 
 class CustomListingCreateModel(BaseModel):
@@ -69,8 +81,122 @@ class CustomListingCreateModel(BaseModel):
     tsEnd: datetime
 
 
+class BidOperationModel(BaseModel):
+    """Bid batch operation model."""
+
+    trackingId: int
+    lot: int
+    price: Optional[float] = None  # None withdraws the bid
+
+
+class BidOperationResultModel(BaseModel):
+    """Bid batch operation result model."""
+
+    trackingId: int
+    lot: int
+    status: int  # HTTP status of the equivalent single-bid request
+    detail: str
+
+
 class PostRequestResponseModel(BaseModel):
     """Post request response model."""
 
     message: str
     status: int
+
+
+class ElevationResponseModel(PostRequestResponseModel):
+    """Privilege elevation response model."""
+
+    access_token: str
+    token_type: str
+
+
+def orjson_default(value: Any) -> Any:
+    """Serialize the values orjson does not support natively."""
+    if isinstance(value, ObjectId):  # Also PydanticObjectId
+        return str(value)
+    if isinstance(value, BaseModel):  # Same as FastAPI's jsonable_encoder
+        return value.dict(by_alias=True)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dump_json(content: Any) -> bytes:
+    """Serialize content (documents, models, datetimes, ...) to JSON."""
+    return orjson.dumps(content, default=orjson_default,
+                        option=orjson.OPT_NON_STR_KEYS
+                        | orjson.OPT_SERIALIZE_NUMPY)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson.
+
+    Return it directly from a route to also skip jsonable_encoder.
+    """
+
+    def render(self, content: Any) -> bytes:
+        """Serialize the content with orjson."""
+        return dump_json(content)
+
+
+# Entity tags of an If-None-Match list (commas may appear inside quotes)
+ENTITY_TAG = re.compile(r'\*|(?:W/)?"[^"]*"')
+
+
+def accepts_encoding(accept_encoding: str, coding: str) -> bool:
+    """Check whether an Accept-Encoding header accepts a content coding.
+
+    The coding's own q-value wins over the one of "*"; q=0 refuses it.
+    """
+    qualities = {}
+    for item in accept_encoding.lower().split(","):
+        name, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name] = quality
+    return qualities.get(coding, qualities.get("*", 0.0)) > 0
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check an If-None-Match header against an ETag.
+
+    Tags are compared weakly (ignoring W/), as RFC 9110 requires here.
+    """
+    opaque = etag.removeprefix("W/")
+    return any(tag == "*" or tag.removeprefix("W/") == opaque
+               for tag in ENTITY_TAG.findall(if_none_match))
+
+
+class CachedResponse:
+    """Pre-serialized and pre-gzipped JSON response body with a strong ETag."""
+
+    def __init__(self, content: Any):
+        """Serialize and compress the content once."""
+        self.body = dump_json(content)
+        self.gzipped = gzip.compress(self.body, mtime=0)
+        self.etag = f'"{sha256(self.body).hexdigest()[:32]}"'
+
+    def not_modified(self, request: Request) -> bool:
+        """Check whether the client's If-None-Match matches the ETag."""
+        if_none_match = request.headers.get("if-none-match")
+        return if_none_match is not None \
+            and etag_matches(if_none_match, self.etag)
+
+    def to_response(self, request: Request) -> Response:
+        """Build a 304 or a (gzipped if accepted) 200 response."""
+        headers = {"ETag": self.etag, "Vary": "Accept-Encoding"}
+        if self.not_modified(request):
+            return Response(status_code=304, headers=headers)
+        if accepts_encoding(request.headers.get("accept-encoding", ""),
+                            "gzip"):
+            headers["Content-Encoding"] = "gzip"
+            return Response(self.gzipped, media_type="application/json",
+                            headers=headers)
+        return Response(self.body, media_type="application/json",
+                        headers=headers)
@@ -0,0 +1,58 @@
+"""Per-worker request latency and cache telemetry."""
+from collections import defaultdict, deque
+from os import getenv
+from time import monotonic
+
+import numpy as np
+
+from modules.cache import user_cache, token_cache, stats_response_cache, \
+    catalogue_cache, company_cache
+from modules.database.lease import WORKER_ID
+from modules.events import broker
+
+# Recent latency samples kept per route
+LATENCY_SAMPLES = int(getenv("LATENCY_SAMPLES", "1000"))
+STARTED_AT = monotonic()
+
+
+class LatencyStats:
+    """Request counters and recent latencies of the routes of a worker."""
+
+    def __init__(self, samples: int):
+        """Keep the last `samples` latencies of every route."""
+        self.counts: defaultdict[str, int] = defaultdict(int)
+        self._samples: defaultdict[str, deque] = \
+            defaultdict(lambda: deque(maxlen=samples))
+
+    def record(self, route: str, seconds: float):
+        """Record the latency of one request."""
+        self.counts[route] += 1
+        self._samples[route].append(seconds * 1000)
+
+    def stats(self) -> dict:
+        """Get the request count and latency percentiles (ms) per route."""
+        routes = {}
+        for route, samples in self._samples.items():
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            routes[route] = {"count": self.counts[route],
+                             "p50": round(float(p50), 3),
+                             "p95": round(float(p95), 3),
+                             "p99": round(float(p99), 3),
+                             "max": round(max(samples), 3)}
+        return routes
+
+
+request_latency = LatencyStats(LATENCY_SAMPLES)
+
+
+def worker_stats() -> dict:
+    """Get the identity, uptime, cache and latency stats of this worker."""
+    return {"worker": WORKER_ID,
+            "uptime": round(monotonic() - STARTED_AT, 3),
+            "caches": {"users": user_cache.stats(),
+                       "tokens": token_cache.stats(),
+                       "stats": stats_response_cache.stats(),
+                       "catalogues": catalogue_cache.stats(),
+                       "companies": company_cache.stats()},
+            "events": broker.stats(),
+            "latency": request_latency.stats()}
@@ -11,12 +11,12 @@ from modules.database.db import add_user, is_user, \
 # from modules.database.db import is_company_accessible, get_user_company, \
 #     set_user_company_inn, set_user_company_name
 # from modules.database.models import User  # , Company
-from modules.fastapi_utils import Token, PostRequestResponseModel, \
-    UserModel
+from modules.fastapi_utils import Token, UserModel, \
+    ElevationResponseModel
 # , TokenData
 from routers.tools import gen_password_hash, authenticate_user, \
     create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, \
-    get_current_user
+    get_current_user, ADMIN_CLAIM
 
 
 router = APIRouter()
@@ -48,14 +48,22 @@ async def signup_and_get_access_token(
         )
 
     # Create a new user
-    hashed_password = gen_password_hash(password)
-    await add_user(email, hashed_password, name,
-                   surname, phone_number, country, city)
+    hashed_password = await gen_password_hash(password)
+    try:
+        await add_user(email, hashed_password, name,
+                       surname, phone_number, country, city)
+    except KeyError:
+        # A concurrent signup won the unique email index
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="User with this email already exists",
+        )
 
     # Generate and return access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": email}, expires_delta=access_token_expires
+        data={"sub": email, ADMIN_CLAIM: False},
+        expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "Bearer"}
 
@@ -74,7 +82,8 @@ async def login_for_access_token(
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user.email, ADMIN_CLAIM: user.isAdmin},
+        expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -94,18 +103,20 @@ async def login_for_access_token_json(
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user.email, ADMIN_CLAIM: user.isAdmin},
+        expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-@router.post("/admin/auth", response_model=PostRequestResponseModel)
+@router.post("/admin/auth", response_model=ElevationResponseModel)
 async def elevate_to_admin(
     current_user: Annotated[UserModel, Depends(get_current_user)],
     password: str
 ):
     """Elevate user's privileges to administrative.
 
+    Return a fresh access token carrying the admin role claim.
     If an incorrect password had been supplied, \
 return status HTTP 401 UNAUTHORIZED
     """
@@ -116,8 +127,15 @@ return status HTTP 401 UNAUTHORIZED
             headers={"WWW-Authenticate": "Bearer"},
         )
     await elevate_privileges(current_user.username)
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": current_user.username, ADMIN_CLAIM: True},
+        expires_delta=access_token_expires
+    )
     return {"message": "Elevated user's privileges to administrative",
-            "status": 0}
+            "status": 0,
+            "access_token": access_token,
+            "token_type": "bearer"}
 
 
 @router.get("/admin")
@@ -1,42 +1,171 @@
 """Custom listings mutation and view."""
-from typing import Annotated, List  # , Optional
-from fastapi import Depends, APIRouter, HTTPException, status
+import asyncio
+from datetime import timedelta
+from os import getenv
+from typing import Annotated, List, AsyncIterator  # , Optional
+from fastapi import Depends, APIRouter, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
 # , HTTPException, status
 
 from modules.database.db import get_all_custom_listings, \
     create_custom_listing, get_custom_listing, \
     get_all_custom_listings_by_company, get_lowest_bid, \
-    declare_custom_listing_winner, place_bid, withdraw_bid, get_bid_list
+    declare_custom_listing_winner, place_bid, withdraw_bid, get_bid_list, \
+    custom_listing_exists, apply_bid_operations, search_custom_listings
+from modules.database.search import words
+from modules.database.scheduler import auction_closer
+from modules.events import broker, EVENTS_KEEPALIVE
 # from modules.database.models import User
 from modules.fastapi_utils import UserModel, CustomListingModel, \
-    CustomListingCreateModel, PostRequestResponseModel
-from .tools import get_current_user
+    CustomListingCreateModel, PostRequestResponseModel, FastJSONResponse, \
+    dump_json, BidOperationModel, BidOperationResultModel, Token
+from .tools import get_current_user, get_current_stream_user, \
+    create_access_token, SCOPE_CLAIM, EVENTS_SCOPE, \
+    EVENTS_TOKEN_EXPIRE_SECONDS
 
 
 router = APIRouter()
 
+# Operations accepted by one batch bid request
+BID_BATCH_SIZE = int(getenv("BID_BATCH_SIZE", "100"))
+
+# Paginated responses carry the cursor of the next page in this header
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def listing_fields(description: bool) -> List[str]:
+    """Get the Custom Listing fields to project for the list views."""
+    fields = list(CustomListingModel.__fields__)
+    if not description:
+        fields.remove("description")
+    return fields
+
+
+def page_response(items: list,
+                  next_cursor: str | None) -> FastJSONResponse:
+    """Serialize a page, passing the next page's cursor in a header."""
+    headers = {} if next_cursor is None \
+        else {NEXT_CURSOR_HEADER: next_cursor}
+    return FastJSONResponse(items, headers=headers)
+
+
+async def server_sent_events(key: tuple) -> AsyncIterator[bytes]:
+    """Stream the events published under a key as Server-Sent Events."""
+    async with broker.subscribe(key) as queue:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            yield (b"event: " + event["type"].encode()
+                   + b"\ndata: " + dump_json(event) + b"\n\n")
+
+
+def bid_operation_result(operation: BidOperationModel,
+                         error: Exception | None) -> dict:
+    """Describe a batch bid operation like its single-bid request."""
+    withdraw = operation.price is None
+    if error is None:
+        code, detail = status.HTTP_200_OK, \
+            "Withdrawn bid successfully" if withdraw \
+            else "Bid placed successfully"
+    elif isinstance(error, PermissionError):
+        code, detail = status.HTTP_403_FORBIDDEN, \
+            "The listing is closed for bids"
+    elif isinstance(error, KeyError):
+        code, detail = status.HTTP_404_NOT_FOUND, "Listing not found"
+    elif withdraw:
+        code, detail = status.HTTP_404_NOT_FOUND, \
+            "A bid from this INN was not found"
+    else:
+        code, detail = status.HTTP_409_CONFLICT, \
+            "A bid from this INN was already placed; remove it first"
+    return {"trackingId": operation.trackingId,
+            "lot": operation.lot,
+            "status": code,
+            "detail": detail}
+
+
+def malformed_cursor() -> HTTPException:
+    """Build the exception raised on a malformed pagination cursor."""
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Malformed pagination cursor",
+    )
+
 
 @router.get("/listings", response_model=List[CustomListingModel])
 async def all_listings_read(
     current_user: Annotated[UserModel, Depends(get_current_user)],
-    active: bool | None = None
+    active: bool | None = None,
+    limit: int | None = Query(None, ge=1),
+    cursor: str | None = None,
+    description: bool = False
 ):
-    """Return Custom Listings (all or be active bool key)."""
-    if active is None:
-        return await get_all_custom_listings()
-    return await get_all_custom_listings(active=active)
+    """Return a page of Custom Listings (all or be active bool key).
+
+    The cursor of the next page is returned in the X-Next-Cursor header.
+    """
+    try:
+        listings, next_cursor = await get_all_custom_listings(
+            active, limit, cursor, listing_fields(description))
+    except ValueError:
+        raise malformed_cursor()
+    return page_response([CustomListingModel.parse_obj(listing)
+                          for listing in listings], next_cursor)
+
+
+@router.get("/listings/search", response_model=List[CustomListingModel])
+async def listings_search(
+    current_user: Annotated[UserModel, Depends(get_current_user)],
+    q: str,
+    active: bool | None = None,
+    kind: str | None = None,
+    limit: int | None = Query(None, ge=1),
+    cursor: str | None = None,
+    description: bool = False
+):
+    """Return a page of Custom Listings matching a search query.
+
+    Every word has to match the name or the description, in any form;
+    the last one may be incomplete. Best matches come first. The cursor
+    of the next page is returned in the X-Next-Cursor header.
+    """
+    if not words(q):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The search query has no words",
+        )
+    try:
+        listings, next_cursor = await search_custom_listings(
+            q, active, kind, limit, cursor, listing_fields(description))
+    except ValueError:
+        raise malformed_cursor()
+    return page_response([CustomListingModel.parse_obj(listing)
+                          for listing in listings], next_cursor)
 
 
 @router.get("/listings/by-company", response_model=List[CustomListingModel])
 async def all_listings_by_company_read(
     current_user: Annotated[UserModel, Depends(get_current_user)],
     inn: int,
-    active: bool | None = None
+    active: bool | None = None,
+    limit: int | None = Query(None, ge=1),
+    cursor: str | None = None,
+    description: bool = False
 ):
-    """Return Custom Listings by a company (all or be active bool key)."""
-    if active is None:
-        return await get_all_custom_listings()
-    return await get_all_custom_listings_by_company(inn, active=active)
+    """Return a page of Custom Listings by a company.
+
+    The cursor of the next page is returned in the X-Next-Cursor header.
+    """
+    try:
+        listings, next_cursor = await get_all_custom_listings_by_company(
+            inn, active, limit, cursor, listing_fields(description))
+    except ValueError:
+        raise malformed_cursor()
+    return page_response([CustomListingModel.parse_obj(listing)
+                          for listing in listings], next_cursor)
 
 
 @router.get("/listing", response_model=CustomListingModel)
@@ -53,6 +182,43 @@ async def listing_read(
     return listing
 
 
+@router.post("/listing/events/token", response_model=Token)
+async def listing_events_token_create(
+    current_user: Annotated[UserModel, Depends(get_current_user)]
+):
+    """Issue a short-lived token for the access_token of /listing/events.
+
+    It is only valid for the event streams, as URLs end up in logs.
+    """
+    access_token = create_access_token(
+        data={"sub": current_user.username, SCOPE_CLAIM: EVENTS_SCOPE},
+        expires_delta=timedelta(seconds=EVENTS_TOKEN_EXPIRE_SECONDS))
+    return {"access_token": access_token, "token_type": "bearer"}
+
+
+@router.get("/listing/events")
+async def listing_events_read(
+    current_user: Annotated[UserModel, Depends(get_current_stream_user)],
+    trackingId: int,
+    lot: int
+):
+    """Stream live events of a Custom Listing (Server-Sent Events).
+
+    Authenticate with the Authorization header or, from an EventSource
+    that cannot set it, with an access_token query parameter issued by
+    POST /listing/events/token. Events are deltas: bid_placed and
+    bid_withdrawn carry the bid and the new bid summary, winner_declared
+    the winner. On resync the client has to refetch the listing and its
+    bids.
+    """
+    if not await custom_listing_exists(trackingId, lot):
+        raise HTTPException(status_code=404, detail="Listing not found")
+    return StreamingResponse(server_sent_events((trackingId, lot)),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache",
+                                      "X-Accel-Buffering": "no"})
+
+
 @router.post("/listing", response_model=PostRequestResponseModel)
 async def listing_create(
     current_user: Annotated[UserModel, Depends(get_current_user)],
@@ -78,6 +244,7 @@ async def listing_create(
             status_code=status.HTTP_409_CONFLICT,
             detail="A listing with the same Tracking ID and Lot already exists"
         )
+    auction_closer.schedule(listing.tsEnd)
 
     return {"message": "Listing created successfully",
             "status": 0}
@@ -144,7 +311,8 @@ async def listing_bid_write(
 ):
     """Place a bid on a Custom Listing.
 
-    Return HTTP 409 CONFLICT if the bid was already placed.
+    Return HTTP 409 CONFLICT if the bid was already placed, 403 FORBIDDEN
+    if the listing is inactive or past its tsEnd.
     """
     try:
         await place_bid(current_user.username,
@@ -155,18 +323,69 @@ async def listing_bid_write(
             status_code=status.HTTP_409_CONFLICT,
             detail="A bid from this INN was already placed; remove it first",
         )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Listing not found")
+    except PermissionError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="The listing is closed for bids",
+        )
     return {"message": "Bid placed successfully",
             "status": 0}
 
 
+@router.post("/listing/bids/batch",
+             response_model=List[BidOperationResultModel])
+async def listing_bids_batch_write(
+    current_user: Annotated[UserModel, Depends(get_current_user)],
+    operations: List[BidOperationModel]
+):
+    """Place (with a price) or withdraw (price null) many bids at once.
+
+    Every operation gets the status code its single-bid request would
+    return; the others are applied even if some fail.
+    """
+    if not 0 < len(operations) <= BID_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Send between 1 and {BID_BATCH_SIZE} operations",
+        )
+    if len({(operation.trackingId, operation.lot)
+            for operation in operations}) < len(operations):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Every operation must target a different listing",
+        )
+    try:
+        errors = await apply_bid_operations(
+            current_user.username,
+            [(operation.trackingId, operation.lot, operation.price)
+             for operation in operations])
+    except ValueError:
+        raise HTTPException(status_code=404, detail="User not found")
+    return FastJSONResponse([bid_operation_result(operation, error)
+                             for operation, error
+                             in zip(operations, errors)])
+
+
 @router.get("/listing/bids")
 async def listing_bids_read(
     current_user: Annotated[UserModel, Depends(get_current_user)],
     listing_tracking_id: int,
-    lot: int
+    lot: int,
+    limit: int | None = Query(None, ge=1),
+    cursor: str | None = None
 ):
-    """Get sorted biddings for a listing."""
-    return await get_bid_list(listing_tracking_id, lot)
+    """Get a page of sorted biddings for a listing.
+
+    The cursor of the next page is returned in the X-Next-Cursor header.
+    """
+    try:
+        bids, next_cursor = await get_bid_list(listing_tracking_id, lot,
+                                               limit, cursor)
+    except ValueError:
+        raise malformed_cursor()
+    return page_response(bids, next_cursor)
 
 
 @router.post("/listing/bid/withdraw", response_model=PostRequestResponseModel)
@@ -0,0 +1,50 @@
+"""Streaming exports of Custom Listings and their bids."""
+from typing import Annotated, AsyncIterator
+from fastapi import Depends, APIRouter, Query
+from fastapi.responses import StreamingResponse
+
+from modules.database.db import iter_custom_listings, \
+    iter_custom_listing_bids
+from modules.fastapi_utils import UserModel, dump_json
+from .tools import get_current_user
+
+
+router = APIRouter()
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+async def ndjson_lines(documents: AsyncIterator[dict]
+                       ) -> AsyncIterator[bytes]:
+    """Serialize documents into newline-delimited JSON, one at a time."""
+    async for document in documents:
+        yield dump_json(document) + b"\n"
+
+
+@router.get("/export/listings")
+async def listings_export(
+    current_user: Annotated[UserModel, Depends(get_current_user)],
+    active: bool | None = None,
+    company_inn: int | None = Query(None, alias="companyInn"),
+    kind: str | None = None
+):
+    """Stream Custom Listings as newline-delimited JSON."""
+    return StreamingResponse(
+        ndjson_lines(iter_custom_listings(active, company_inn, kind)),
+        media_type=NDJSON_MEDIA_TYPE)
+
+
+@router.get("/export/bids")
+async def bids_export(
+    current_user: Annotated[UserModel, Depends(get_current_user)],
+    active: bool | None = None,
+    company_inn: int | None = Query(None, alias="companyInn"),
+    kind: str | None = None
+):
+    """Stream bids as newline-delimited JSON.
+
+    The filters select the Custom Listings whose bids are exported.
+    """
+    return StreamingResponse(
+        ndjson_lines(iter_custom_listing_bids(active, company_inn, kind)),
+        media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,131 @@
+"""Bulk imports of Custom Listings."""
+import csv
+from typing import Annotated, AsyncIterator, List, Tuple
+import orjson
+from fastapi import Depends, APIRouter, HTTPException, status, Request
+from pydantic import ValidationError
+
+from modules.database.db import import_custom_listings
+from modules.database.scheduler import auction_closer
+from modules.fastapi_utils import UserModel, CustomListingCreateModel
+from .tools import get_current_user
+
+
+router = APIRouter()
+
+CSV_MEDIA_TYPE = "text/csv"
+
+
+async def text_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a UTF-8 byte stream into lines, one at a time."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8-sig").rstrip("\r")
+
+
+async def ndjson_records(lines: AsyncIterator[str]
+                         ) -> AsyncIterator[Tuple[int, dict | None]]:
+    """Parse newline-delimited JSON objects (None when malformed)."""
+    row = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            record = orjson.loads(line)
+        except orjson.JSONDecodeError:
+            record = None
+        yield row, record if isinstance(record, dict) else None
+
+
+async def csv_records(lines: AsyncIterator[str]
+                      ) -> AsyncIterator[Tuple[int, dict | None]]:
+    """Parse CSV rows keyed by the header row (None when malformed)."""
+    header: List[str] | None = None
+    row = 0
+    pending = ""
+    async for line in lines:
+        pending += line
+        # A quoted field spans lines until its quotes are balanced
+        if pending.count('"') % 2:
+            pending += "\n"
+            continue
+        line, pending = pending, ""
+        if not line.strip():
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row += 1
+        yield row, dict(zip(header, values)) \
+            if len(values) == len(header) else None
+
+
+def describe_validation_error(error: ValidationError) -> str:
+    """Flatten a validation error into one line."""
+    return "; ".join(f"{'.'.join(map(str, detail['loc']))}: {detail['msg']}"
+                     for detail in error.errors())
+
+
+@router.post("/listings/import")
+async def listings_import(
+    current_user: Annotated[UserModel, Depends(get_current_user)],
+    request: Request
+):
+    """Create Custom Listings from a JSON lines or CSV (text/csv) upload.
+
+    Rows have the fields of POST /listing; a CSV starts with a header
+    row. Invalid rows (422) and existing listings (409) are reported per
+    row, the other rows are created.
+    """
+    lines = text_lines(request.stream())
+    if request.headers.get("content-type", "").startswith(CSV_MEDIA_TYPE):
+        records = csv_records(lines)
+    else:
+        records = ndjson_records(lines)
+    errors: List[dict] = []
+
+    async def valid_listings() -> AsyncIterator[Tuple[int, dict]]:
+        """Validate the rows, collecting the errors of invalid ones."""
+        async for row, record in records:
+            if record is None:
+                errors.append({"row": row,
+                               "status": status.HTTP_422_UNPROCESSABLE_ENTITY,
+                               "detail": "Malformed row"})
+                continue
+            try:
+                listing = CustomListingCreateModel.parse_obj(record)
+            except ValidationError as error:
+                errors.append({"row": row,
+                               "status": status.HTTP_422_UNPROCESSABLE_ENTITY,
+                               "detail": describe_validation_error(error)})
+                continue
+            auction_closer.schedule(listing.tsEnd)
+            yield row, listing.dict()
+
+    try:
+        created, duplicates = await import_custom_listings(
+            current_user.username, valid_listings())
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="The upload must be UTF-8 encoded",
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_428_PRECONDITION_REQUIRED,
+            detail="Some of the user's company fields are null",
+        )
+    errors += [{"row": row,
+                "status": status.HTTP_409_CONFLICT,
+                "detail": "A listing with the same Tracking ID and Lot "
+                          "already exists"}
+               for row in duplicates]
+    errors.sort(key=lambda error: error["row"])
+    return {"created": created, "errors": errors}
@@ -5,6 +5,7 @@ from fastapi import Depends, APIRouter, HTTPException, status
 from modules.database.db import is_company_accessible, get_user_company, \
     set_user_company_inn, set_user_company_name, update_user_first_name, \
     update_user_last_name, get_user
+from modules.cache import user_cache
 from modules.database.models import User
 from modules.fastapi_utils import UserModel, UserEditModel
 from .tools import get_current_user, convert_user
@@ -54,6 +55,7 @@ country, city
            'city': (data.city
                     if data.city
                     else current_user.city)}))
+    user_cache.invalidate(current_user.username)
     new_user_details = await User.find_one(User.email == current_user.username)
     if new_user_details is None:
         raise HTTPException(
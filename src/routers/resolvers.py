@@ -1,8 +1,11 @@
 """Resolve values into different values."""
-from typing import Annotated  # , Optional
-from fastapi import Depends, APIRouter, HTTPException, status
+from os import getenv
+from typing import Annotated, List  # , Optional
+from fastapi import Depends, APIRouter, HTTPException, status, Query
+from pymongo.errors import PyMongoError
 
-from modules.database.db import get_company_name_by_inn
+from modules.database.db import get_company_name_by_inn, \
+    get_company_names_by_inn, ping_db
 # from modules.database.models import User  # , Company
 from modules.fastapi_utils import UserModel  # , Token, TokenData
 from .tools import get_current_user
@@ -10,6 +13,9 @@ from .tools import get_current_user
 
 router = APIRouter()
 
+# INNs accepted by one batch resolve request
+RESOLVE_BATCH_SIZE = int(getenv("RESOLVE_BATCH_SIZE", "500"))
+
 
 @router.get("/resolve/company/by-inn")
 async def resolve_company_name_by_inn(
@@ -30,7 +36,40 @@ async def resolve_company_name_by_inn(
     return {"name": name}
 
 
+@router.get("/resolve/company/by-inns")
+async def resolve_company_names_by_inns(
+    current_user: Annotated[UserModel, Depends(get_current_user)],
+    inn: List[int] = Query(...)
+):
+    """Resolve the company names of many INNs (`?inn=1&inn=2`).
+
+    Unknown INNs are listed apart instead of failing the request.
+    """
+    if len(inn) > RESOLVE_BATCH_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Send at most {RESOLVE_BATCH_SIZE} INNs",
+        )
+    names = await get_company_names_by_inn(inn)
+    return {"names": {str(company_inn): name
+                      for company_inn, name in names.items()},
+            "unknown": sorted(set(inn) - names.keys())}
+
+
 @router.get("/")
 async def root():
     """Root service function."""
     return {"message": "Hello World"}
+
+
+@router.get("/health")
+async def health():
+    """Check that the service can reach the database."""
+    try:
+        database = await ping_db()
+    except (PyMongoError, RuntimeError):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database is unreachable",
+        )
+    return {"status": "ok", "database": database}
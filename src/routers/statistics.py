@@ -1,99 +1,132 @@
 """Resolve values into different values."""
 from typing import Annotated, Optional
-from fastapi import Depends, APIRouter, HTTPException, status
+from fastapi import Depends, APIRouter, HTTPException, status, Request, \
+    Response
 import random
 
-from modules.database.db import is_admin, get_daily_statistics, \
-    get_monthly_statistics, get_yearly_statistics, get_all_scripts
+from modules.database.db import get_statistics_series, get_all_scripts
+from modules.database.rollup import get_series
 # from modules.database.models import User  # , Company
-from modules.fastapi_utils import UserModel  # , Token, TokenData
-from .tools import get_current_user
+from modules.cache import stats_response_cache, STATS_LIVE_CACHE_TTL
+from modules.fastapi_utils import TokenData, CachedResponse, \
+    FastJSONResponse
+from modules.telemetry import worker_stats
+# , Token, UserModel
+from .tools import get_current_admin
 
 
 router = APIRouter()
 
 
+def series_not_found() -> HTTPException:
+    """Build the exception raised on a missing statistics series."""
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Statistics series is not found",
+    )
+
+
+async def statistics_response(request: Request,
+                              granularity: str,
+                              pid: int | None,
+                              metric: str | None) -> Response:
+    """Serve a statistics series from the response cache.
+
+    A metric selects a live rollup series instead of a stored one.
+    """
+    key = (granularity, 0 if pid is None else pid) if metric is None \
+        else (granularity, metric)
+    cached = stats_response_cache.get(key)
+    if cached is None:
+        if metric is None:
+            series = await get_statistics_series(*key)  # type: ignore
+        else:
+            series = await get_series(metric, granularity)
+        if series is None:
+            raise series_not_found()
+        cached = CachedResponse(series)
+        stats_response_cache.set(
+            key, cached, ttl=None if metric is None else STATS_LIVE_CACHE_TTL)
+    return cached.to_response(request)
+
+
 @router.get("/stats/daily")
 async def statistics_daily_read(
-    current_user: Annotated[UserModel, Depends(get_current_user)],
-    pid: Optional[int] = None
+    current_admin: Annotated[TokenData, Depends(get_current_admin)],
+    request: Request,
+    pid: Optional[int] = None,
+    metric: Optional[str] = None
 ):
-    """Get daily statistics (admin-only)."""
-    if not await is_admin(current_user.username):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not enough rights to visit this page",
-        )
-    if pid is None:
-        return (await get_daily_statistics())[0]  # type: ignore
-    return (await get_daily_statistics())[pid]  # type: ignore
+    """Get daily statistics (admin-only).
+
+    Pass a metric ("bids", "listings", "signups") for live statistics.
+    """
+    return await statistics_response(request, "daily", pid, metric)
 
 
 @router.get("/stats/monthly")
 async def statistics_monthly_read(
-    current_user: Annotated[UserModel, Depends(get_current_user)],
-    pid: Optional[int] = None
+    current_admin: Annotated[TokenData, Depends(get_current_admin)],
+    request: Request,
+    pid: Optional[int] = None,
+    metric: Optional[str] = None
 ):
-    """Get monthly statistics (admin-only)."""
-    if not await is_admin(current_user.username):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not enough rights to visit this page",
-        )
-    if pid is None:
-        return (await get_monthly_statistics())[0]  # type: ignore
-    return (await get_monthly_statistics())[pid]  # type: ignore
+    """Get monthly statistics (admin-only).
+
+    Pass a metric ("bids", "listings", "signups") for live statistics.
+    """
+    return await statistics_response(request, "monthly", pid, metric)
 
 
 @router.get("/stats/yearly")
 async def statistics_yearly_read(
-    current_user: Annotated[UserModel, Depends(get_current_user)],
-    pid: Optional[int] = None
+    current_admin: Annotated[TokenData, Depends(get_current_admin)],
+    request: Request,
+    pid: Optional[int] = None,
+    metric: Optional[str] = None
 ):
-    """Get yearly statistics (admin-only)."""
-    if not await is_admin(current_user.username):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not enough rights to visit this page",
-        )
-    if pid is None:
-        return (await get_yearly_statistics())[0]  # type: ignore
-    return (await get_yearly_statistics())[pid]  # type: ignore
+    """Get yearly statistics (admin-only).
+
+    Pass a metric ("bids", "listings", "signups") for live statistics.
+    """
+    return await statistics_response(request, "yearly", pid, metric)
 
 
 # region Admin
 @router.get("/admin/scripts")
 async def admin_scripts_read(
-    current_user: Annotated[UserModel, Depends(get_current_user)],
+    current_admin: Annotated[TokenData, Depends(get_current_admin)],
     limit: Optional[int] = None
 ):
     """Get all scripts (admin-only)."""
-    if not await is_admin(current_user.username):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not enough rights to visit this page",
-        )
     scripts = await get_all_scripts()
     if limit:
         if len(scripts) > limit:
             scripts = scripts[:limit]
-    return scripts
+    return FastJSONResponse(scripts)
 
 
 @router.get("/admin/scripts/by-metric")
 async def admin_scripts_by_metric_read(
-    current_user: Annotated[UserModel, Depends(get_current_user)],
+    current_admin: Annotated[TokenData, Depends(get_current_admin)],
     metric: Optional[str] = None,
     limit: Optional[int] = None
 ):
     """Get all scripts (admin-only)."""
-    if not await is_admin(current_user.username):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Not enough rights to visit this page",
-        )
     scripts = await get_all_scripts()
     return random.sample(scripts, 3)
 
+
+@router.get("/admin/worker")
+@router.get("/admin/cache", deprecated=True)
+async def admin_worker_read(
+    current_admin: Annotated[TokenData, Depends(get_current_admin)]
+):
+    """Get cache and per-route latency stats of this worker (admin-only).
+
+    /admin/cache is kept as an alias: its cache stats are under "caches".
+    """
+    return worker_stats()
+
 # @router.
 # endregion
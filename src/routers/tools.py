@@ -1,5 +1,9 @@
 """Tools for FastAPI Server."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from os import getenv
+from hashlib import sha256
+from time import time
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from typing import Annotated  # , Optional
@@ -8,21 +12,44 @@ from fastapi.security import OAuth2PasswordBearer
 # , OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 
-from modules.database.db import get_user, get_password_hash
+from modules.cache import user_cache, token_cache
+from modules.database.db import get_user
 from modules.fastapi_utils import TokenData, UserModel
 from modules.database.models import User
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token",
+                                              auto_error=False)
 # `openssl rand -hex 32``
 SECRET_KEY = getenv("JWT_SECRET", "")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Token claim carrying the user's administrative role
+ADMIN_CLAIM = "adm"
+# Token claim restricting a token to one use, such as EVENTS_SCOPE
+SCOPE_CLAIM = "scp"
+# Scope of the tokens passed in the URL of the live event streams
+EVENTS_SCOPE = "events"
+EVENTS_TOKEN_EXPIRE_SECONDS = int(getenv("EVENTS_TOKEN_EXPIRE_SECONDS",
+                                         "60"))
+# bcrypt is CPU-bound and releases the GIL: run it off the event loop,
+# at most PASSWORD_HASH_WORKERS hashes at a time
+password_hash_executor = ThreadPoolExecutor(
+    max_workers=int(getenv("PASSWORD_HASH_WORKERS", "4")),
+    thread_name_prefix="bcrypt")
 
 
-def gen_password_hash(password: str) -> str:
+async def gen_password_hash(password: str) -> str:
     """Get hash from supplied string."""
-    return pwd_context.hash(password)
+    return await asyncio.get_running_loop().run_in_executor(
+        password_hash_executor, pwd_context.hash, password)
+
+
+async def verify_password(password: str, password_hash: str) -> bool:
+    """Verify supplied password against its hash."""
+    return await asyncio.get_running_loop().run_in_executor(
+        password_hash_executor, pwd_context.verify, password, password_hash)
 
 
 async def authenticate_user(email: str, password: str):
@@ -30,7 +57,7 @@ async def authenticate_user(email: str, password: str):
     user = await get_user(email)
     if not user:
         return None
-    if not pwd_context.verify(password, await get_password_hash(email)):
+    if not await verify_password(password, user.passwordHash):
         return None
     return user
 
@@ -48,31 +75,114 @@ def create_access_token(data: dict,
     return encoded_jwt
 
 
-async def get_current_user(
-        token: Annotated[str, Depends(oauth2_scheme)]) -> UserModel:
-    """Get user's information from their JWT token."""
-    credentials_exception = HTTPException(
+def decode_access_token(token: str) -> dict:
+    """Verify a JWT token and return its payload.
+
+    Verified payloads are cached by token digest until the token expires.
+    Raise JWTError if the token is invalid.
+    """
+    digest = sha256(token.encode()).digest()
+    payload = token_cache.get(digest)
+    if payload is not None:
+        return payload
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    if isinstance(payload.get("exp"), (int, float)):
+        token_cache.set(digest, payload, ttl=payload["exp"] - time())
+    return payload
+
+
+def credentials_exception() -> HTTPException:
+    """Build the exception raised on invalid credentials."""
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def verify_token(token: str, scope: str | None = None) -> dict:
+    """Get the verified payload of a JWT token of the given scope.
+
+    Raise HTTPException 401 if it is invalid or of another scope.
+    """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")  # type: ignore
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
+        payload = decode_access_token(token)
     except JWTError:
-        raise credentials_exception
-    assert isinstance(token_data.username, str)  # nosec
+        raise credentials_exception()
+    if payload.get("sub") is None or payload.get(SCOPE_CLAIM) != scope:
+        raise credentials_exception()
+    return payload
+
+
+async def get_token_data(
+        token: Annotated[str, Depends(oauth2_scheme)]) -> dict:
+    """Get the verified payload of the user's JWT token."""
+    return verify_token(token)
+
+
+async def get_stream_token_data(
+        token: Annotated[str | None, Depends(optional_oauth2_scheme)],
+        access_token: str | None = None) -> dict:
+    """Get the verified payload of the token of an event stream.
+
+    EventSource cannot send headers: the token may come in the
+    access_token query parameter instead, scoped to EVENTS_SCOPE.
+    """
+    if token is not None:
+        return verify_token(token)
+    if access_token is not None:
+        return verify_token(access_token, EVENTS_SCOPE)
+    raise credentials_exception()
+
+
+async def load_current_user(payload: dict) -> UserModel:
+    """Get user's information from their verified token payload."""
+    token_data = TokenData(username=payload["sub"])
+    username = token_data.username
+    user_model = user_cache.get(username)
+    if user_model is not None:
+        return user_model
     user = await get_user(username)
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
     assert user is not None  # nosec
     user_model = await convert_user(user)
+    user_cache.set(username, user_model)
     return user_model
 
 
+async def get_current_user(
+        payload: Annotated[dict, Depends(get_token_data)]) -> UserModel:
+    """Get user's information from their JWT token."""
+    return await load_current_user(payload)
+
+
+async def get_current_stream_user(
+        payload: Annotated[dict, Depends(get_stream_token_data)]
+) -> UserModel:
+    """Get user's information from the token of an event stream."""
+    return await load_current_user(payload)
+
+
+async def get_current_admin(
+        payload: Annotated[dict, Depends(get_token_data)]) -> TokenData:
+    """Check the admin role claim of the user's JWT token.
+
+    Tokens minted before the role claim existed fall back to the database.
+    """
+    token_data = TokenData(username=payload["sub"])
+    admin = payload.get(ADMIN_CLAIM)
+    if admin is None:
+        user = await get_user(token_data.username)
+        admin = user is not None and user.isAdmin
+    if not admin:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not enough rights to visit this page",
+        )
+    return token_data
+
+
 async def convert_user(user: User) -> UserModel:
     """Convert User DB model to Pydantic UserModel."""
     return UserModel(username=str(user.email),
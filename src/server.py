@@ -1,18 +1,40 @@
 """Docstring."""
+import asyncio
+import logging
 from os import getenv
+from time import perf_counter
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
-
-from modules.database.db import init_db
-from routers import auth, profile, customs, resolvers, statistics
-from modules.database.models import Metric, TaskGoal, Task, Script, \
-    StatisticsProto
+from jose import JWTError
+from starlette.datastructures import Headers
+from pymongo.errors import PyMongoError
+
+from modules.database.db import init_db, close_db, warm_up_db, \
+    migrate_statistics_proto, backfill_search_terms, repair_bid_state
+from routers import auth, profile, customs, resolvers, statistics, \
+    exports, imports
+from modules.database import activity, lease
+from modules.database.scheduler import auction_closer
+from modules.database.seed import seed_fixtures
+from modules.fastapi_utils import FastJSONResponse
+from modules.telemetry import request_latency
+from modules.events import broker
+from routers.tools import decode_access_token
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-
-app = FastAPI()
+logger = logging.getLogger(__name__)
+# Seconds between DAU/WAU/MAU recomputations
+ACTIVITY_METRICS_INTERVAL = float(getenv("ACTIVITY_METRICS_INTERVAL", "600"))
+ACTIVITY_METRICS_LEASE = "activity-metrics"
+background_tasks: set = set()
+# Seed the fixtures on startup, or only with `manage.py seed` if disabled
+SEED_ON_STARTUP = getenv("SEED_ON_STARTUP", "1") == "1"
+# Seconds a worker may hold the startup (migrate and seed) lease
+STARTUP_LEASE_TTL = float(getenv("STARTUP_LEASE_TTL", "300"))
+
+app = FastAPI(default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +42,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[customs.NEXT_CURSOR_HEADER],
 )
 
 app.include_router(auth.router)
@@ -27,6 +50,54 @@ app.include_router(profile.router)
 app.include_router(customs.router)
 app.include_router(resolvers.router)
 app.include_router(statistics.router)
+app.include_router(exports.router)
+app.include_router(imports.router)
+
+
+class RequestRecorder:
+    """Record the latency and the user activity of every request.
+
+    A pure ASGI middleware: unlike @app.middleware layers, it does not
+    buffer the response, and the activity is recorded once it is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = perf_counter()
+        await self.app(scope, receive, send_wrapper)
+        # The router stores the matched route in the scope
+        route = scope.get("route")
+        path = route.path if route is not None else "<unmatched>"
+        request_latency.record(f"{scope['method']} {path}",
+                               perf_counter() - started)
+        if status_code >= 400:
+            return
+        authorization = Headers(scope=scope).get("authorization", "")
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() != "bearer":
+            return
+        try:
+            await activity.record_activity(decode_access_token(token)["sub"])
+        except (JWTError, KeyError):
+            pass
+        except PyMongoError:
+            logger.exception("Could not record user activity")
+
+
+app.add_middleware(RequestRecorder)
 
 
 @app.on_event("startup")
@@ -37,42 +108,58 @@ async def start_db():
                   getenv("MONGODB_HOST", ""),
                   getenv("MONGODB_PORT", ""))
 
-    await load_mock_data("modules/database/mock_data/mock_achievements.json",
-                         "modules/database/mock_data/mock_statistics.json")
-
-
-async def load_mock_data(achievements_f: str,
-                         statistics_f: str):
-    """Fill the Beanie scripts, metrics, ... with data from a JSON file."""
-    # Do not re-populate the database - check if any scripts exist
-    if len(await Script.find().to_list()) != 0:
-        return
-
-    from json import load
-    with open(achievements_f, 'r') as f:
-        data = load(f)
-
-    for script in data['scripts']:
-        await Script.insert_one(Script(**script))
-
-    for task in data['tasks']:
-        await Task.insert_one(Task(**task))
-
-    for task_goal in data['task_goals']:
-        await TaskGoal.insert_one(TaskGoal(**task_goal))
-
-    for metric in data['metrics']:
-        await Metric.insert_one(Metric(**metric))
-
-    with open(statistics_f, 'r') as f:
-        data_stat: dict = load(f)['statistics']
-
-    await StatisticsProto.insert_one(StatisticsProto(daily=data_stat['day'],
-                                                     monthly=None,
-                                                     yearly=None))
-
-    (await (await StatisticsProto.find_one())  # type: ignore
-        .set({StatisticsProto.monthly: data_stat['month']}))  # type: ignore
-
-    (await (await StatisticsProto.find_one())  # type: ignore
-        .set({StatisticsProto.yearly: data_stat['year']}))  # type: ignore
+    # Only one worker of the fleet migrates and seeds at a time, the
+    # others skip it (both steps are idempotent)
+    if await lease.acquire("startup", STARTUP_LEASE_TTL):
+        try:
+            await migrate_statistics_proto()
+            await backfill_search_terms()
+            await repair_bid_state(missing_only=True)
+            if SEED_ON_STARTUP:
+                await seed_fixtures()
+        finally:
+            await lease.release("startup")
+    await warm_up_db()
+    await broker.start()
+
+    background_tasks.add(asyncio.create_task(compute_activity_metrics()))
+    background_tasks.add(asyncio.create_task(auction_closer.run()))
+    background_tasks.add(asyncio.create_task(broker.relay_invalidations()))
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    """Cancel background tasks on FastAPI shutdown."""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+
+
+@app.on_event("shutdown")
+async def stop_db():
+    """Close the database connection pool on FastAPI shutdown."""
+    try:
+        await broker.flush_invalidations()
+    except PyMongoError:
+        logger.exception("Could not relay cache invalidations")
+    await broker.stop()
+    await auction_closer.stop()
+    await lease.release(ACTIVITY_METRICS_LEASE)
+    close_db()
+
+
+async def compute_activity_metrics():
+    """Periodically recompute today's DAU/WAU/MAU metrics.
+
+    One worker of the fleet (the holder of the lease) computes them.
+    """
+    while True:
+        # Idle workers would keep yesterday's recorded bits until a request
+        activity.forget_past_days()
+        try:
+            if await lease.acquire(ACTIVITY_METRICS_LEASE,
+                                   ACTIVITY_METRICS_INTERVAL * 3):
+                await activity.compute_metrics()
+        except Exception:
+            logger.exception("Could not compute activity metrics")
+        await asyncio.sleep(ACTIVITY_METRICS_INTERVAL)